@@ -0,0 +1,41 @@
+#dependencies.py
+
+import asyncio
+import logging
+
+from fastapi import Request
+
+from app.core.scheduler import WorkloadContext, workload_context, workload_timeout
+
+logger = logging.getLogger(__name__)
+
+async def _watch_disconnect(request: Request, context: WorkloadContext):
+    """Cancel queued work as soon as the client disconnects"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            dropped = context.cancel()
+            if dropped:
+                logger.info(f"Client disconnected, cancelled {dropped} pending {context.workload} jobs")
+            return
+
+def workload(name: str):
+    """Dependency tagging a route with a workload class, deadline and disconnect watcher"""
+
+    async def dependency(request: Request):
+        timeout = workload_timeout(name)
+        header = request.headers.get("x-request-timeout")
+        if header:
+            try:
+                timeout = float(header) if timeout is None else min(float(header), timeout)
+            except ValueError:
+                pass
+
+        with workload_context(name, timeout) as context:
+            watcher = asyncio.create_task(_watch_disconnect(request, context))
+            try:
+                yield context
+            finally:
+                watcher.cancel()
+
+    return dependency
@@ -0,0 +1,132 @@
+from fastapi import APIRouter, HTTPException, Depends, Request, Query, Header
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import asyncio
+import secrets
+import threading
+import logging
+
+from app.api.models.admin_schema import IndexActivateRequest, IndexStatusResponse, LoopStallsResponse
+from app.api.dependencies import workload
+from app.services.dating_services import DatingService
+from app.core.config import settings
+from app.core.errors import ServiceError
+from app.core.embedding_index import current_version, set_current_version, has_version
+from app.core.profiling import LoopMonitor, sample_stacks, collapsed
+
+logger = logging.getLogger(__name__)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin routes are off unless ADMIN_API_TOKEN is set, and then need it in X-Admin-Token"""
+    if not settings.admin_api_token:
+        raise HTTPException(status_code=404, detail="Admin API is disabled")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_api_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+def get_dating_service(request: Request) -> DatingService:
+    """Dependency to get dating service"""
+    return request.app.state.dating_service
+
+@router.get("/index", response_model=IndexStatusResponse)
+async def get_index_status(
+    dating_service: DatingService = Depends(get_dating_service)
+):
+    """Active embedding index and all versions on disk"""
+    try:
+        return IndexStatusResponse(**await dating_service.index_status())
+        
+    except Exception as e:
+        logger.error(f"Index status error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/index/activate", response_model=IndexStatusResponse, dependencies=[Depends(workload("batch"))])
+async def activate_index(
+    activate_request: IndexActivateRequest,
+    dating_service: DatingService = Depends(get_dating_service)
+):
+    """Switch this worker to a re-embedded index version"""
+    try:
+        version = activate_request.version or current_version(settings.embedding_index_dir)
+        if not version:
+            raise HTTPException(status_code=400, detail="No index version given and no CURRENT pointer")
+        if not has_version(settings.embedding_index_dir, version):
+            raise HTTPException(status_code=404, detail=f"Unknown index version: {version}")
+        
+        if not await dating_service.activate_index(version):
+            raise HTTPException(status_code=409, detail=f"Index {version} is not ready")
+        
+        if activate_request.set_current:
+            set_current_version(settings.embedding_index_dir, version)
+        
+        return IndexStatusResponse(**await dating_service.index_status())
+        
+    except (HTTPException, ServiceError):
+        raise
+    except Exception as e:
+        logger.error(f"Index activation error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def get_loop_monitor(request: Request) -> Optional[LoopMonitor]:
+    """Dependency to get the event-loop monitor, if enabled"""
+    return getattr(request.app.state, 'loop_monitor', None)
+
+@router.get("/loop/stalls", response_model=LoopStallsResponse)
+async def get_loop_stalls(
+    limit: int = Query(20, ge=1, le=1000),
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+    monitor: Optional[LoopMonitor] = Depends(get_loop_monitor)
+):
+    """Recent event-loop stalls with the stacks that blocked the loop"""
+    try:
+        if format == "collapsed":
+            return PlainTextResponse(monitor.collapsed_stalls() if monitor else "")
+        
+        return LoopStallsResponse(
+            enabled=monitor is not None,
+            stats=monitor.stats() if monitor else {},
+            stalls=monitor.recent_stalls(limit) if monitor else []
+        )
+        
+    except Exception as e:
+        logger.error(f"Loop stalls error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_process(
+    seconds: float = Query(5.0, gt=0),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    loop_only: bool = Query(False, description="Sample only the event loop thread"),
+    include_idle: bool = Query(False, description="Keep samples of threads waiting on I/O or locks")
+):
+    """Time-boxed sampling profile of the live process, as folded stacks for a flamegraph"""
+    try:
+        if not settings.profiler_enabled:
+            raise HTTPException(status_code=404, detail="Profiler is disabled")
+        if seconds > settings.profile_max_seconds:
+            raise HTTPException(status_code=400, detail=f"seconds must be at most {settings.profile_max_seconds}")
+        
+        thread_ids = {threading.get_ident()} if loop_only else None
+        loop = asyncio.get_running_loop()
+        try:
+            # Sampled from a worker thread so the loop keeps serving (and shows up in the profile)
+            profile = await loop.run_in_executor(
+                None, sample_stacks, seconds, interval_ms / 1000, thread_ids, include_idle
+            )
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        
+        return PlainTextResponse(
+            collapsed(profile['stacks']),
+            headers={
+                "X-Profile-Samples": str(profile['samples']),
+                "X-Profile-Duration": f"{profile['duration']:.3f}",
+            }
+        )
+        
+    except (HTTPException, ServiceError):
+        raise
+    except Exception as e:
+        logger.error(f"Profile error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -2,7 +2,13 @@ from fastapi import APIRouter, HTTPException, Depends, Request
 import logging
 from datetime import datetime
 
-from app.api.models.chatbot_schema import ChatRequest, ChatResponse, ConversationStarterRequest, ConversationStarterResponse
+from app.api.models.chatbot_schema import (
+    ChatRequest, ChatResponse, ConversationStarterRequest, ConversationStarterResponse,
+    BatchStarterRequest, BatchStarterResponse
+)
+from app.api.dependencies import workload
+from app.core.config import settings
+from app.core.errors import ServiceError
 from app.services.chat_services import ChatService
 from app.services.dating_services import DatingService
 
@@ -17,7 +23,7 @@ def get_chat_service(request: Request) -> ChatService:
     """Dependency to get chat service"""
     return request.app.state.chat_service
 
-@router.post("/response", response_model=ChatResponse)
+@router.post("/response", response_model=ChatResponse, dependencies=[Depends(workload("chat"))])
 async def generate_chat_response(
     chat_request: ChatRequest,
     chat_service: ChatService = Depends(get_chat_service)
@@ -34,6 +40,8 @@ async def generate_chat_response(
             timestamp=datetime.now().isoformat()
         )
         
+    except (HTTPException, ServiceError):
+        raise
     except Exception as e:
         logger.error(f"Chat response error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -57,11 +65,58 @@ async def generate_conversation_opener(
         return ConversationStarterResponse(
             starter=starter,
             target_user=user.get('name', 'User'),
+            target_user_id=user.get('id'),
             timestamp=datetime.now().isoformat()
         )
         
-    except HTTPException:
+    except (HTTPException, ServiceError):
         raise
     except Exception as e:
         logger.error(f"Conversation starter error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/openers", response_model=BatchStarterResponse, dependencies=[Depends(workload("chat"))])
+async def generate_conversation_openers(
+    batch_request: BatchStarterRequest,
+    dating_service: DatingService = Depends(get_dating_service),
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """Generate conversation starters for a whole page of profiles in one call"""
+    try:
+        if len(batch_request.target_user_ids) > settings.max_openers_per_request:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {settings.max_openers_per_request} openers per request"
+            )
+        
+        users = []
+        missing = []
+        for user_id in dict.fromkeys(batch_request.target_user_ids):
+            user = await dating_service.get_user_by_id(user_id)
+            if user:
+                users.append(user)
+            else:
+                missing.append(user_id)
+        
+        starters = await chat_service.generate_conversation_starters(users, batch_request.personalized)
+        timestamp = datetime.now().isoformat()
+        
+        return BatchStarterResponse(
+            starters=[
+                ConversationStarterResponse(
+                    starter=starter,
+                    target_user=user.get('name', 'User'),
+                    target_user_id=user.get('id'),
+                    timestamp=timestamp
+                )
+                for user, starter in zip(users, starters)
+            ],
+            missing_user_ids=missing,
+            timestamp=timestamp
+        )
+        
+    except (HTTPException, ServiceError):
+        raise
+    except Exception as e:
+        logger.error(f"Batch conversation starter error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -3,8 +3,15 @@ from typing import List
 import logging
 from datetime import datetime
 
-from app.api.models.dating_schema import SearchRequest, SearchResponse, UserProfile, MatchResult
+from app.api.models.dating_schema import (
+    SearchRequest, SearchResponse, UserProfile, MatchResult, InteractionRequest, InteractionResponse
+)
+from app.api.dependencies import workload
+from app.api.responses import FastJSONResponse
 from app.services.dating_services import DatingService
+from app.core.config import settings
+from app.core.errors import ServiceError
+from app.core.serialization import dumps, json_array, json_object
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -13,19 +20,44 @@ def get_dating_service(request: Request) -> DatingService:
     """Dependency to get dating service"""
     return request.app.state.dating_service
 
-@router.post("/search", response_model=SearchResponse)
+@router.post("/search", response_model=SearchResponse, dependencies=[Depends(workload("search"))])
 async def search_profiles(
     search_request: SearchRequest,
     dating_service: DatingService = Depends(get_dating_service)
 ):
     """Search for profiles using natural language query"""
     try:
-        results = await dating_service.search_profiles(
+        geo_filters = {
+            key: value
+            for key, value in (
+                ('location', search_request.location),
+                ('radius_km', search_request.radius_km),
+                ('nearest', search_request.nearest),
+            )
+            if value is not None
+        }
+        
+        search_kwargs = dict(
             query=search_request.query,
             user_id=search_request.user_id,
-            top_k=search_request.top_k
+            top_k=search_request.top_k,
+            field_weights=search_request.field_weights,
+            diversity_lambda=search_request.diversity_lambda,
+            geo_filters=geo_filters
         )
         
+        if settings.fast_serialization:
+            fragments = await dating_service.search_profiles_json(**search_kwargs)
+            return FastJSONResponse(json_object({
+                'success': b'true',
+                'query': dumps(search_request.query),
+                'total_results': str(len(fragments)).encode('ascii'),
+                'results': json_array(fragments),
+                'timestamp': dumps(datetime.now().isoformat())
+            }))
+        
+        results = await dating_service.search_profiles(**search_kwargs)
+        
         return SearchResponse(
             success=True,
             query=search_request.query,
@@ -34,6 +66,10 @@ async def search_profiles(
             timestamp=datetime.now().isoformat()
         )
         
+    except (HTTPException, ServiceError):
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Search error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -45,13 +81,19 @@ async def get_user_profile(
 ):
     """Get user profile by ID"""
     try:
+        if settings.fast_serialization:
+            content = await dating_service.get_user_json(user_id)
+            if content is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            return FastJSONResponse(content)
+        
         user = await dating_service.get_user_by_id(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         return UserProfile(**user)
         
-    except HTTPException:
+    except (HTTPException, ServiceError):
         raise
     except Exception as e:
         logger.error(f"Get user error: {e}")
@@ -63,6 +105,9 @@ async def get_all_users(
 ):
     """Get all user profiles"""
     try:
+        if settings.fast_serialization:
+            return FastJSONResponse(await dating_service.get_all_users_json())
+        
         users = await dating_service.get_all_users()
         return [UserProfile(**user) for user in users]
         
@@ -70,7 +115,7 @@ async def get_all_users(
         logger.error(f"Get all users error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/match/{user_id}", response_model=List[MatchResult])
+@router.post("/match/{user_id}", response_model=List[MatchResult], dependencies=[Depends(workload("search"))])
 async def get_matches_for_user(
     user_id: str,
     top_k: int = 5,
@@ -87,16 +132,50 @@ async def get_matches_for_user(
         relationship_type = user.get('relationship_type', '')
         query = f"Looking for {relationship_type} relationship with someone who likes {interests}"
         
+        if settings.fast_serialization:
+            fragments = await dating_service.search_profiles_json(
+                query=query,
+                user_id=user_id,
+                top_k=top_k,
+                use_preferences=True
+            )
+            return FastJSONResponse(json_array(fragments))
+        
         results = await dating_service.search_profiles(
             query=query,
             user_id=user_id,
-            top_k=top_k
+            top_k=top_k,
+            use_preferences=True
         )
         
         return [MatchResult(**result) for result in results]
         
-    except HTTPException:
+    except (HTTPException, ServiceError):
         raise
     except Exception as e:
         logger.error(f"Match error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/interactions", response_model=InteractionResponse)
+async def record_interactions(
+    interaction_request: InteractionRequest,
+    dating_service: DatingService = Depends(get_dating_service)
+):
+    """Record likes, passes and openers sent; logged and learned from in the background"""
+    try:
+        accepted, rejected = await dating_service.record_interactions(
+            [event.model_dump() for event in interaction_request.events]
+        )
+        
+        return InteractionResponse(
+            success=True,
+            accepted=accepted,
+            rejected=rejected,
+            timestamp=datetime.now().isoformat()
+        )
+        
+    except (HTTPException, ServiceError):
+        raise
+    except Exception as e:
+        logger.error(f"Record interactions error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,17 @@
+#errors.py
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from app.core.errors import ServiceError, Overloaded
+from app.core.scheduler import DeadlineExceeded, ClientDisconnected
+
+async def service_error_handler(request: Request, exc: ServiceError) -> JSONResponse:
+    """Translate domain errors of the services into HTTP responses"""
+    if isinstance(exc, Overloaded):
+        return JSONResponse({"detail": exc.detail}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
+    if isinstance(exc, DeadlineExceeded):
+        return JSONResponse({"detail": exc.detail}, status_code=504)
+    if isinstance(exc, ClientDisconnected):
+        return JSONResponse({"detail": exc.detail}, status_code=499)
+    return JSONResponse({"detail": exc.detail}, status_code=500)
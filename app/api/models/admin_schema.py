@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any
+
+class IndexActivateRequest(BaseModel):
+    version: Optional[str] = Field(None, description="Index version to switch to (defaults to the CURRENT pointer)")
+    set_current: bool = Field(True, description="Also point CURRENT at this version so restarted workers follow")
+
+class LoopStall(BaseModel):
+    started: str
+    duration_ms: Optional[float] = Field(None, description="None while the loop is still blocked")
+    stack: List[str]
+    collapsed: str = Field(..., description="Folded stacks sampled during the stall")
+
+class LoopStallsResponse(BaseModel):
+    enabled: bool
+    stats: Dict[str, Any]
+    stalls: List[LoopStall]
+
+class IndexStatusResponse(BaseModel):
+    active_version: Optional[str]
+    model_name: str
+    current_version: Optional[str]
+    versions: List[Dict[str, Any]]
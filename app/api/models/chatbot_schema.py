@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Optional, List
 
 class ChatRequest(BaseModel):
     message: str = Field(..., description="User message")
@@ -15,4 +15,14 @@ class ConversationStarterRequest(BaseModel):
 class ConversationStarterResponse(BaseModel):
     starter: str
     target_user: str
+    target_user_id: Optional[str] = None
+    timestamp: str
+
+class BatchStarterRequest(BaseModel):
+    target_user_ids: List[str] = Field(..., description="IDs of users to generate starters for", min_length=1)
+    personalized: bool = Field(False, description="Generate openers with the LLM instead of templates")
+
+class BatchStarterResponse(BaseModel):
+    starters: List[ConversationStarterResponse]
+    missing_user_ids: List[str]
     timestamp: str
\ No newline at end of file
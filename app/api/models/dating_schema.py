@@ -5,6 +5,11 @@ class SearchRequest(BaseModel):
     query: str = Field(..., description="Natural language search query")
     user_id: Optional[str] = Field(None, description="ID of the searching user")
     top_k: Optional[int] = Field(5, description="Number of results to return", ge=1, le=20)
+    field_weights: Optional[Dict[str, float]] = Field(None, description="Per-field weights (bio, interests, career, location, relationship)")
+    diversity_lambda: Optional[float] = Field(None, description="MMR trade-off between relevance (1.0) and diversity (0.0)", ge=0, le=1)
+    location: Optional[str] = Field(None, description="Location to search around, overrides the one found in the query")
+    radius_km: Optional[float] = Field(None, description="Search radius around the location in km", gt=0)
+    nearest: Optional[int] = Field(None, description="Restrict to the N profiles closest to the location", ge=1)
 
 class SearchResponse(BaseModel):
     success: bool
@@ -35,4 +40,19 @@ class MatchResult(BaseModel):
     bio: str
     relationship_type: str
     similarity_score: float
-    match_percentage: int
\ No newline at end of file
+    match_percentage: int
+
+class InteractionEvent(BaseModel):
+    user_id: str = Field(..., description="ID of the user who acted")
+    target_id: str = Field(..., description="ID of the profile they acted on")
+    action: str = Field(..., description="Interaction type: like, pass or opener")
+    timestamp: Optional[float] = Field(None, description="Unix time of the interaction, defaults to the receive time")
+
+class InteractionRequest(BaseModel):
+    events: List[InteractionEvent] = Field(..., description="Interactions to record", min_length=1, max_length=10000)
+
+class InteractionResponse(BaseModel):
+    success: bool
+    accepted: int
+    rejected: int
+    timestamp: str
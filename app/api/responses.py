@@ -0,0 +1,16 @@
+#responses.py
+
+from typing import Any
+
+from fastapi.responses import Response
+
+from app.core.serialization import dumps
+
+class FastJSONResponse(Response):
+    """Response carrying already-encoded JSON, skipping response_model validation"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        return dumps(content)
@@ -3,7 +3,6 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, List
 import re
-from sentence_transformers import SentenceTransformer
 import logging
 
 logger = logging.getLogger(__name__)
@@ -76,6 +75,21 @@ class FilterExtractorAgent(BaseAgent):
         if location_match:
             filters['location'] = location_match.group(2)
         
+        # Radius extraction ("within 30 km", "within 10 miles of Boston")
+        # Place names stay case-sensitive so the rest of the query is not taken for a place
+        radius_match = re.search(
+            r'(?i:\bwithin\s+(\d+(?:\.\d+)?)\s*(km|kilometers?|kilometres?|mi|miles?)\b)'
+            r'(?:\s+(?i:of|from)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*))?',
+            query
+        )
+        if radius_match:
+            distance = float(radius_match.group(1))
+            if radius_match.group(2).lower().startswith('mi'):
+                distance *= 1.609344
+            filters['radius_km'] = distance
+            if radius_match.group(3) and 'location' not in filters:
+                filters['location'] = radius_match.group(3)
+        
         # Relationship type
         if re.search(r'\b(serious|long.?term|committed)\b', query, re.IGNORECASE):
             filters['relationship_type'] = 'serious'
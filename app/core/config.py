@@ -1,7 +1,7 @@
 # config.py
 
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, Dict
 import os
 from pathlib import Path
 
@@ -26,6 +26,85 @@ class Settings(BaseSettings):
     default_top_k: int = 5
     similarity_threshold: float = 0.3
     
+    # Embedding Storage Configuration
+    embedding_precision: str = "float32"  # float32, float16, int8 or pq
+    embedding_pq_subvectors: int = 8
+    embedding_pq_centroids: int = 256
+    embedding_rerank_top: int = 0  # exact float32 rerank of the top candidates (0 disables)
+    embedding_cache_dir: str = "data/cache"  # runtime artifacts live outside the package
+    embedding_index_dir: str = "data/indexes"  # versioned indexes written by app.jobs.reembed
+    embedding_index_poll_s: float = 0.0  # follow the CURRENT pointer automatically (0 disables)
+    embedding_index_retry_max_s: float = 900.0  # longest wait before retrying a version that failed to load
+    
+    # Admin API: /api/v1/admin/* needs this token in X-Admin-Token and is disabled while it is unset
+    admin_api_token: Optional[str] = None
+    
+    # Field weights for multi-vector profile scoring (overridable per request)
+    profile_field_weights: Dict[str, float] = {
+        "bio": 1.0,
+        "interests": 1.0,
+        "career": 0.75,
+        "location": 0.25,
+        "relationship": 0.5,
+    }
+    
+    # Location Search
+    gazetteer_path: Optional[str] = None  # optional JSON of extra "city, region": [lat, lon] entries
+    default_location_radius_km: float = 40.0
+    
+    # Conversation Openers
+    opener_cache_size: int = 10000
+    max_openers_per_request: int = 50
+    
+    # Diversity Reranking (MMR): 1.0 is pure relevance, lower values favour variety
+    default_diversity_lambda: Optional[float] = None
+    mmr_candidates: int = 200
+    
+    # Response Serialization: pre-serialized JSON fragments without re-validation
+    fast_serialization: bool = True
+    
+    # Workload Scheduling: bounded executor, queue limit and deadline per workload class
+    scheduler_cpu_slots: int = 0  # concurrent jobs across all classes (0 = search + chat workers, at most the CPU count)
+    search_workers: int = 4
+    search_queue_limit: int = 64
+    search_timeout_s: float = 5.0
+    chat_workers: int = 2
+    chat_queue_limit: int = 16
+    chat_timeout_s: float = 30.0
+    batch_workers: int = 1
+    batch_queue_limit: int = 256
+    batch_timeout_s: float = 600.0
+    
+    # Sharded Search: scatter-gather over local shard processes (0 keeps the corpus in-process)
+    search_shards: int = 0
+    shard_timeout_s: float = 2.0  # slower shards are left out of the merged results
+    
+    # Interaction Log: batched write-behind segments, replayed into preference vectors at startup
+    interaction_log_dir: str = "data/interactions"
+    interaction_segment_bytes: int = 64 * 1024 * 1024
+    interaction_flush_interval_s: float = 0.2
+    interaction_max_pending: int = 1000000  # unflushed events before ingestion returns 503
+    interaction_apply_interval_s: float = 0.5
+    interaction_weights: Dict[str, float] = {
+        "like": 1.0,
+        "opener": 1.5,
+        "pass": -0.5,
+    }
+    
+    # Preference Vectors: learned from interactions and blended into /match scoring
+    preference_decay: float = 0.98  # per interaction of the same user
+    preference_weight: float = 0.3  # share of the preference vector in the match query (0 disables)
+    preference_min_interactions: int = 3
+    preference_snapshot_interval_s: float = 300.0  # startup replays only events after the last snapshot (0 disables)
+    preference_replay_limit: int = 2000000  # newest events relearned without a matching snapshot (0 = whole log)
+    
+    # Event-Loop Monitoring: stalls above the threshold are recorded with the blocking stack
+    loop_stall_threshold_ms: float = 100.0  # 0 disables the monitor
+    loop_monitor_interval_ms: float = 20.0
+    loop_stall_history: int = 100
+    profiler_enabled: bool = False  # /api/v1/admin/profile, off unless explicitly enabled
+    profile_max_seconds: float = 30.0  # upper bound for /api/v1/admin/profile
+    
     # File paths
     base_dir: Path = Path(__file__).parent.parent.parent
     
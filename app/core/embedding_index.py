@@ -0,0 +1,87 @@
+#embedding_index.py
+
+from typing import Dict, Any, List, Optional
+from pathlib import Path
+import hashlib
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+
+def model_slug(model_name: str) -> str:
+    return model_name.replace('/', '__')
+
+def corpus_hash(users: List[Dict[str, Any]]) -> str:
+    """Stable hash of a profile corpus"""
+    payload = json.dumps(users, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def default_version(model_name: str, users: List[Dict[str, Any]]) -> str:
+    """Deterministic version name, so rerunning a job resumes its checkpoints"""
+    return f"{model_slug(model_name).split('__')[-1]}-{corpus_hash(users)[:10]}"
+
+def _write_atomic(path: Path, content: str):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+def is_version_name(version: str) -> bool:
+    """A plain directory name, never a path that could leave the index directory"""
+    return bool(version) and version not in ('.', '..') and Path(version).name == version and '\\' not in version
+
+def has_version(index_dir: str, version: str) -> bool:
+    """Whether version is one of the index versions on disk"""
+    return is_version_name(version) and version in {manifest.get('version') for manifest in list_versions(index_dir)}
+
+def read_manifest(index_dir: str, version: str) -> Optional[Dict[str, Any]]:
+    """Manifest of an index version, or None if it does not exist"""
+    if not is_version_name(version):
+        logger.warning(f"Ignoring invalid index version name: {version!r}")
+        return None
+    path = Path(index_dir) / version / MANIFEST
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except Exception as e:
+        logger.error(f"Error reading index manifest {path}: {e}")
+        return None
+
+def write_manifest(index_dir: str, version: str, manifest: Dict[str, Any]):
+    path = Path(index_dir) / version
+    path.mkdir(parents=True, exist_ok=True)
+    _write_atomic(path / MANIFEST, json.dumps(manifest, indent=2))
+
+def list_versions(index_dir: str) -> List[Dict[str, Any]]:
+    """Manifests of all index versions"""
+    root = Path(index_dir)
+    if not root.exists():
+        return []
+    manifests = []
+    for path in sorted(root.iterdir()):
+        manifest = read_manifest(index_dir, path.name) if path.is_dir() else None
+        if manifest is not None and manifest.get('version') == path.name:
+            manifests.append(manifest)
+    return manifests
+
+def current_version(index_dir: str) -> Optional[str]:
+    """Version the CURRENT pointer designates as live"""
+    path = Path(index_dir) / CURRENT
+    if not path.exists():
+        return None
+    version = path.read_text(encoding='utf-8').strip()
+    return version or None
+
+def set_current_version(index_dir: str, version: str):
+    """Atomically point CURRENT at a ready index version"""
+    manifest = read_manifest(index_dir, version)
+    if manifest is None or manifest.get('status') != 'ready':
+        raise ValueError(f"Index version {version} is not ready")
+    Path(index_dir).mkdir(parents=True, exist_ok=True)
+    _write_atomic(Path(index_dir) / CURRENT, version)
@@ -0,0 +1,266 @@
+#embedding_store.py
+
+from typing import Optional
+from pathlib import Path
+import os
+import tempfile
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRECISIONS = ("float32", "float16", "int8", "pq")
+
+class EmbeddingStore:
+    """Normalized profile embeddings kept in a compact storage format"""
+
+    def __init__(
+        self,
+        precision: str = "float32",
+        pq_subvectors: int = 8,
+        pq_centroids: int = 256,
+        rerank_top: int = 0,
+        cache_dir: Optional[str] = None,
+        block_size: int = 4096
+    ):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown embedding precision: {precision}")
+
+        self.precision = precision
+        self.pq_subvectors = pq_subvectors
+        self.pq_centroids = min(pq_centroids, 256)
+        self.rerank_top = rerank_top
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.block_size = block_size
+
+        self.dim = 0
+        self.count = 0
+        self.vectors: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        self.exact: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        """In-memory size of the compact representation"""
+        total = 0
+        for array in (self.vectors, self.scales, self.codebooks):
+            if array is not None:
+                total += array.nbytes
+        return total
+
+    @staticmethod
+    def normalize(embeddings: np.ndarray) -> np.ndarray:
+        """L2-normalize rows so dot products are cosine similarities"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+
+    def build(self, embeddings: np.ndarray, normalize: bool = True):
+        """Encode raw model embeddings into the configured format"""
+        normalized = self.normalize(embeddings) if normalize else np.asarray(embeddings, dtype=np.float32)
+        self.count, self.dim = normalized.shape
+        self.codebooks = None
+
+        if self.precision == "pq":
+            self.codebooks = self._train_pq(normalized)
+        self.vectors, self.scales = self._encode(normalized)
+
+        self.exact = None
+        if self.rerank_top > 0 and self.precision != "float32":
+            self.exact = self._store_exact(normalized)
+
+        logger.info(
+            f"Built {self.precision} embedding store: {self.count} x {self.dim}, "
+            f"{self.nbytes / 1024:.1f} KiB (float32 would be {normalized.nbytes / 1024:.1f} KiB)"
+        )
+
+    def set_rows(self, rows: np.ndarray, embeddings: np.ndarray, normalize: bool = True):
+        """Replace or append rows in place, encoded with the existing scales and codebooks"""
+        rows = np.asarray(rows, dtype=np.int64)
+        normalized = self.normalize(embeddings) if normalize else np.asarray(embeddings, dtype=np.float32)
+        if self.vectors is None:
+            self.build(normalized, normalize=False)
+            return
+
+        codes, scales = self._encode(normalized)
+        count = max(self.count, int(rows.max()) + 1 if len(rows) else 0)
+        if count > len(self.vectors):
+            self._reserve(count)
+
+        self.vectors[rows] = codes
+        if scales is not None:
+            self.scales[rows] = scales
+        if self.exact is not None:
+            self.exact[rows] = normalized
+        # Appended rows become visible to searches only once fully written
+        self.count = count
+
+    def _reserve(self, count: int):
+        """Grow the arrays with spare room, so appends copy the store only once in a while"""
+        capacity = max(count, len(self.vectors) + len(self.vectors) // 8, 1024)
+        self.vectors = self._grown(self.vectors, capacity)
+        if self.scales is not None:
+            self.scales = self._grown(self.scales, capacity)
+        if self.exact is not None:
+            self.exact = self._store_exact(self._grown(np.asarray(self.exact), capacity))
+
+    @staticmethod
+    def _grown(array: np.ndarray, count: int) -> np.ndarray:
+        """Copy of an array with room for count rows"""
+        grown = np.zeros((count,) + array.shape[1:], dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def scores(self, query_embedding: np.ndarray, indices: Optional[np.ndarray] = None, normalize: bool = True) -> np.ndarray:
+        """Cosine similarity of the query against stored rows (all rows or a subset)"""
+        if self.vectors is None:
+            return np.zeros(0, dtype=np.float32)
+
+        if normalize:
+            query = self.normalize(query_embedding)[0]
+        else:
+            query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        rows = np.arange(self.count) if indices is None else np.asarray(indices, dtype=np.int64)
+
+        if self.precision == "pq":
+            scores = self._score_pq(query, rows)
+        else:
+            scores = self._score_dense(query, rows)
+
+        if self.exact is not None and len(rows) > 0:
+            scores = self._rerank(query, rows, scores)
+
+        return scores
+
+    def decode(self, indices: np.ndarray) -> np.ndarray:
+        """Approximate float32 vectors for a subset of rows"""
+        rows = np.asarray(indices, dtype=np.int64)
+        if len(rows) == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if self.precision == "pq":
+            subvectors = self.codebooks.shape[0]
+            codes = self.vectors[rows]
+            return self.codebooks[np.arange(subvectors), codes].reshape(len(rows), self.dim)
+        vectors = self.vectors[rows].astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows, None]
+        return vectors
+
+    def _score_dense(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Blockwise dot products over float32/float16/int8 rows"""
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), self.block_size):
+            block_rows = rows[start:start + self.block_size]
+            block = self.vectors[block_rows].astype(np.float32, copy=False)
+            block_scores = block @ query
+            if self.scales is not None:
+                block_scores *= self.scales[block_rows]
+            scores[start:start + len(block_rows)] = block_scores
+        return scores
+
+    def _score_pq(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Asymmetric distance computation with per-subspace lookup tables"""
+        subvectors = self.codebooks.shape[0]
+        query_parts = query.reshape(subvectors, -1)
+        lookup = np.einsum('mkd,md->mk', self.codebooks, query_parts)
+        codes = self.vectors[rows]
+        return lookup[np.arange(subvectors), codes].sum(axis=1).astype(np.float32)
+
+    def _rerank(self, query: np.ndarray, rows: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """Replace approximate scores of the top candidates with exact float32 scores"""
+        top = min(self.rerank_top, len(rows))
+        candidates = np.argpartition(-scores, top - 1)[:top]
+        scores[candidates] = np.asarray(self.exact[rows[candidates]]) @ query
+        return scores
+
+    def _encode(self, normalized: np.ndarray):
+        """Codes of normalized rows in the configured format, with int8 scales"""
+        if self.precision == "float32":
+            return normalized, None
+        if self.precision == "float16":
+            return normalized.astype(np.float16), None
+        if self.precision == "int8":
+            return self._quantize_int8(normalized)
+        return self._encode_pq(normalized), None
+
+    @staticmethod
+    def _quantize_int8(normalized: np.ndarray):
+        """Symmetric per-row scalar quantization"""
+        scales = np.abs(normalized).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(normalized / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _train_pq(self, normalized: np.ndarray, iterations: int = 10, sample_size: int = 20000) -> np.ndarray:
+        """Train one k-means codebook per subspace"""
+        subvectors = self.pq_subvectors
+        if self.dim % subvectors != 0:
+            raise ValueError(f"Embedding dim {self.dim} is not divisible by {subvectors} PQ subvectors")
+
+        rng = np.random.default_rng(0)
+        sample = normalized
+        if len(sample) > sample_size:
+            sample = sample[rng.choice(len(sample), sample_size, replace=False)]
+
+        centroids = min(self.pq_centroids, len(sample))
+        parts = sample.reshape(len(sample), subvectors, -1)
+        codebooks = np.empty((subvectors, centroids, parts.shape[2]), dtype=np.float32)
+
+        for m in range(subvectors):
+            data = parts[:, m, :]
+            centers = data[rng.choice(len(data), centroids, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = self._nearest(data, centers)
+                sums = np.zeros_like(centers)
+                np.add.at(sums, assignment, data)
+                counts = np.bincount(assignment, minlength=centroids)
+                filled = counts > 0
+                centers[filled] = sums[filled] / counts[filled, None]
+            codebooks[m] = centers
+
+        return codebooks
+
+    def _encode_pq(self, normalized: np.ndarray) -> np.ndarray:
+        """Assign every subvector to its nearest centroid"""
+        subvectors = self.codebooks.shape[0]
+        parts = normalized.reshape(len(normalized), subvectors, -1)
+        codes = np.empty((len(normalized), subvectors), dtype=np.uint8)
+        for m in range(subvectors):
+            codes[:, m] = self._nearest(parts[:, m, :], self.codebooks[m])
+        return codes
+
+    @staticmethod
+    def _nearest(data: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        """Index of the nearest center for each row"""
+        distances = (
+            (data ** 2).sum(axis=1, keepdims=True)
+            - 2 * data @ centers.T
+            + (centers ** 2).sum(axis=1)
+        )
+        return distances.argmin(axis=1)
+
+    def _store_exact(self, normalized: np.ndarray) -> np.ndarray:
+        """Keep float32 vectors for reranking, memory-mapped from disk when possible"""
+        if self.cache_dir is None:
+            return normalized
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Unique, already-unlinked file: rebuilds and other workers never truncate a live mapping
+            fd, path = tempfile.mkstemp(prefix="exact_embeddings-", suffix=".npy", dir=self.cache_dir)
+            with os.fdopen(fd, 'wb') as file:
+                np.save(file, normalized)
+            # Writable, so rows can be updated in place
+            exact = np.load(path, mmap_mode='r+')
+            os.unlink(path)
+            return exact
+        except OSError as e:
+            logger.warning(f"Could not memory-map exact embeddings, keeping them in memory: {e}")
+            return normalized
@@ -0,0 +1,16 @@
+#errors.py
+"""Domain errors of the core services, translated into responses by the API layer"""
+
+class ServiceError(Exception):
+    """Base class for failures reported to the client as they are"""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+class Overloaded(ServiceError):
+    """Work was shed or no backend could take it; the client may retry shortly"""
+
+    def __init__(self, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.retry_after = retry_after
@@ -0,0 +1,310 @@
+#geo.py
+
+from typing import Dict, Optional, Tuple, Set, List
+from pathlib import Path
+import json
+import math
+import re
+import threading
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+# Offline gazetteer: "city, region" -> (latitude, longitude)
+GAZETTEER: Dict[str, Tuple[float, float]] = {
+    "new york, ny": (40.7128, -74.0060),
+    "brooklyn, ny": (40.6782, -73.9442),
+    "buffalo, ny": (42.8864, -78.8784),
+    "jersey city, nj": (40.7178, -74.0431),
+    "newark, nj": (40.7357, -74.1724),
+    "philadelphia, pa": (39.9526, -75.1652),
+    "pittsburgh, pa": (40.4406, -79.9959),
+    "boston, ma": (42.3601, -71.0589),
+    "cambridge, ma": (42.3736, -71.1097),
+    "providence, ri": (41.8240, -71.4128),
+    "hartford, ct": (41.7658, -72.6734),
+    "washington, dc": (38.9072, -77.0369),
+    "baltimore, md": (39.2904, -76.6122),
+    "arlington, va": (38.8816, -77.0910),
+    "richmond, va": (37.5407, -77.4360),
+    "raleigh, nc": (35.7796, -78.6382),
+    "charlotte, nc": (35.2271, -80.8431),
+    "atlanta, ga": (33.7490, -84.3880),
+    "nashville, tn": (36.1627, -86.7816),
+    "memphis, tn": (35.1495, -90.0490),
+    "miami, fl": (25.7617, -80.1918),
+    "orlando, fl": (28.5383, -81.3792),
+    "tampa, fl": (27.9506, -82.4572),
+    "jacksonville, fl": (30.3322, -81.6557),
+    "new orleans, la": (29.9511, -90.0715),
+    "chicago, il": (41.8781, -87.6298),
+    "detroit, mi": (42.3314, -83.0458),
+    "ann arbor, mi": (42.2808, -83.7430),
+    "cleveland, oh": (41.4993, -81.6944),
+    "columbus, oh": (39.9612, -82.9988),
+    "cincinnati, oh": (39.1031, -84.5120),
+    "indianapolis, in": (39.7684, -86.1581),
+    "milwaukee, wi": (43.0389, -87.9065),
+    "madison, wi": (43.0731, -89.4012),
+    "minneapolis, mn": (44.9778, -93.2650),
+    "st. louis, mo": (38.6270, -90.1994),
+    "kansas city, mo": (39.0997, -94.5786),
+    "omaha, ne": (41.2565, -95.9345),
+    "dallas, tx": (32.7767, -96.7970),
+    "fort worth, tx": (32.7555, -97.3308),
+    "houston, tx": (29.7604, -95.3698),
+    "austin, tx": (30.2672, -97.7431),
+    "san antonio, tx": (29.4241, -98.4936),
+    "el paso, tx": (31.7619, -106.4850),
+    "oklahoma city, ok": (35.4676, -97.5164),
+    "denver, co": (39.7392, -104.9903),
+    "boulder, co": (40.0150, -105.2705),
+    "salt lake city, ut": (40.7608, -111.8910),
+    "phoenix, az": (33.4484, -112.0740),
+    "tucson, az": (32.2226, -110.9747),
+    "albuquerque, nm": (35.0844, -106.6504),
+    "las vegas, nv": (36.1699, -115.1398),
+    "los angeles, ca": (34.0522, -118.2437),
+    "santa monica, ca": (34.0195, -118.4912),
+    "san diego, ca": (32.7157, -117.1611),
+    "san francisco, ca": (37.7749, -122.4194),
+    "oakland, ca": (37.8044, -122.2712),
+    "san jose, ca": (37.3382, -121.8863),
+    "palo alto, ca": (37.4419, -122.1430),
+    "sacramento, ca": (38.5816, -121.4944),
+    "portland, or": (45.5152, -122.6784),
+    "seattle, wa": (47.6062, -122.3321),
+    "bellevue, wa": (47.6101, -122.2015),
+    "honolulu, hi": (21.3069, -157.8583),
+    "anchorage, ak": (61.2181, -149.9003),
+    "toronto, on": (43.6532, -79.3832),
+    "montreal, qc": (45.5017, -73.5673),
+    "vancouver, bc": (49.2827, -123.1207),
+    "mexico city, mx": (19.4326, -99.1332),
+    "london, uk": (51.5074, -0.1278),
+    "paris, fr": (48.8566, 2.3522),
+    "berlin, de": (52.5200, 13.4050),
+    "madrid, es": (40.4168, -3.7038),
+    "rome, it": (41.9028, 12.4964),
+    "amsterdam, nl": (52.3676, 4.9041),
+    "dublin, ie": (53.3498, -6.2603),
+    "stockholm, se": (59.3293, 18.0686),
+    "dubai, ae": (25.2048, 55.2708),
+    "mumbai, in": (19.0760, 72.8777),
+    "delhi, in": (28.7041, 77.1025),
+    "dhaka, bd": (23.8103, 90.4125),
+    "singapore, sg": (1.3521, 103.8198),
+    "tokyo, jp": (35.6762, 139.6503),
+    "seoul, kr": (37.5665, 126.9780),
+    "sydney, au": (-33.8688, 151.2093),
+    "melbourne, au": (-37.8136, 144.9631),
+    "sao paulo, br": (-23.5505, -46.6333),
+}
+
+ALIASES: Dict[str, str] = {
+    "nyc": "new york, ny",
+    "manhattan": "new york, ny",
+    "sf": "san francisco, ca",
+    "la": "los angeles, ca",
+    "dc": "washington, dc",
+    "bay area": "san francisco, ca",
+    "silicon valley": "san jose, ca",
+}
+
+def to_unit_vector(lat: float, lon: float) -> np.ndarray:
+    """Point on the unit sphere for a latitude/longitude pair"""
+    lat_r, lon_r = math.radians(lat), math.radians(lon)
+    return np.array([
+        math.cos(lat_r) * math.cos(lon_r),
+        math.cos(lat_r) * math.sin(lon_r),
+        math.sin(lat_r)
+    ], dtype=np.float64)
+
+class Gazetteer:
+    """Offline lookup of profile location strings to coordinates"""
+
+    def __init__(self, extra_path: Optional[str] = None):
+        self.places: Dict[str, Tuple[float, float]] = dict(GAZETTEER)
+        self.aliases: Dict[str, str] = dict(ALIASES)
+
+        if extra_path and Path(extra_path).exists():
+            try:
+                with open(extra_path, 'r', encoding='utf-8') as file:
+                    extra = json.load(file)
+                for name, coords in extra.items():
+                    self.places[self._normalize(name)] = (float(coords[0]), float(coords[1]))
+                logger.info(f"Loaded {len(extra)} extra gazetteer entries from {extra_path}")
+            except Exception as e:
+                logger.error(f"Error loading gazetteer {extra_path}: {e}")
+
+        # City names without region resolve when unambiguous
+        cities: Dict[str, List[str]] = {}
+        for name in self.places:
+            cities.setdefault(name.split(',')[0].strip(), []).append(name)
+        for city, names in cities.items():
+            if len(names) == 1 and city not in self.aliases and city not in self.places:
+                self.aliases[city] = names[0]
+
+    @staticmethod
+    def _normalize(location: str) -> str:
+        location = re.sub(r'\s+', ' ', location.strip().lower())
+        return re.sub(r'\s*,\s*', ', ', location)
+
+    def lookup(self, location: str) -> Optional[Tuple[float, float]]:
+        """Coordinates for a location string, or None when unknown"""
+        if not location:
+            return None
+        name = self._normalize(location)
+        name = self.aliases.get(name, name)
+        return self.places.get(name)
+
+class GeoIndex:
+    """Grid index over profile coordinates for radius and nearest-N row masks"""
+
+    def __init__(self, gazetteer: Gazetteer, cell_degrees: float = 1.0):
+        self.gazetteer = gazetteer
+        self.cell_degrees = cell_degrees
+        self.lon_cells = int(math.ceil(360 / cell_degrees))
+        self.cells: Dict[Tuple[int, int], Set[int]] = {}
+        self.row_cells: Dict[int, Tuple[int, int]] = {}
+        self.units = np.zeros((0, 3), dtype=np.float64)
+        self.size = 0
+        # Rows are updated in place while search threads read the cells
+        self._lock = threading.Lock()
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        lat_cell = int(math.floor((lat + 90) / self.cell_degrees))
+        lon_cell = int(math.floor((lon + 180) / self.cell_degrees)) % self.lon_cells
+        return lat_cell, lon_cell
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= len(self.units):
+            return
+        capacity = max(rows, 2 * len(self.units), 64)
+        units = np.zeros((capacity, 3), dtype=np.float64)
+        units[:len(self.units)] = self.units
+        self.units = units
+
+    def build(self, locations: List[str]):
+        """Index every row from scratch"""
+        with self._lock:
+            self.cells = {}
+            self.row_cells = {}
+            self.units = np.zeros((0, 3), dtype=np.float64)
+            self.size = 0
+        for row, location in enumerate(locations):
+            self.update(row, location)
+        logger.info(f"Geo index: located {len(self.row_cells)} of {len(locations)} profiles")
+
+    def update(self, row: int, location: str) -> bool:
+        """Insert or move one row; returns False if the location is unknown"""
+        coords = self.gazetteer.lookup(location)
+        with self._lock:
+            self._remove(row)
+            self.size = max(self.size, row + 1)
+            if coords is None:
+                return False
+
+            self._ensure_capacity(row + 1)
+            self.units[row] = to_unit_vector(*coords)
+            cell = self._cell(*coords)
+            self.cells.setdefault(cell, set()).add(row)
+            self.row_cells[row] = cell
+            return True
+
+    def remove(self, row: int):
+        """Drop a row from the index"""
+        with self._lock:
+            self._remove(row)
+
+    def _remove(self, row: int):
+        cell = self.row_cells.pop(row, None)
+        if cell is None:
+            return
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(row)
+            if not members:
+                del self.cells[cell]
+
+    def located_mask(self) -> np.ndarray:
+        """Rows that have coordinates"""
+        with self._lock:
+            mask = np.zeros(self.size, dtype=bool)
+            if self.row_cells:
+                mask[list(self.row_cells)] = True
+        return mask
+
+    def _candidate_rows(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Rows in grid cells overlapping the bounding box of the circle"""
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        lat_min, lat_max = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        lat_range = range(self._cell(lat_min, 0)[0], self._cell(lat_max, 0)[0] + 1)
+
+        cos_lat = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+        dlon = 180.0 if cos_lat < 1e-6 else math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+
+        rows: List[int] = []
+        with self._lock:
+            if dlon >= 180:
+                for (lat_cell, _), members in self.cells.items():
+                    if lat_cell in lat_range:
+                        rows.extend(members)
+            else:
+                first = int(math.floor((lon - dlon + 180) / self.cell_degrees))
+                last = int(math.floor((lon + dlon + 180) / self.cell_degrees))
+                lon_range = {cell % self.lon_cells for cell in range(first, last + 1)}
+                for lat_cell in lat_range:
+                    for lon_cell in lon_range:
+                        rows.extend(self.cells.get((lat_cell, lon_cell), ()))
+
+        return np.asarray(rows, dtype=np.int64)
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Row mask of profiles within radius_km of a point"""
+        rows = self._candidate_rows(lat, lon, radius_km)
+        # Sized after the lookup: a row is only in a cell once size covers it
+        mask = np.zeros(self.size, dtype=bool)
+        if len(rows) == 0:
+            return mask
+
+        cos_limit = math.cos(min(radius_km / EARTH_RADIUS_KM, math.pi))
+        inside = self.units[rows] @ to_unit_vector(lat, lon) >= cos_limit
+        mask[rows[inside]] = True
+        return mask
+
+    def nearest_distance(self, lat: float, lon: float, count: int) -> Optional[float]:
+        """Great-circle distance in km to the count-th closest profile"""
+        rows = np.flatnonzero(self.nearest(lat, lon, count))
+        if len(rows) == 0:
+            return None
+        closeness = np.clip(self.units[rows] @ to_unit_vector(lat, lon), -1.0, 1.0)
+        return float(np.arccos(closeness.min()) * EARTH_RADIUS_KM)
+
+    def nearest(self, lat: float, lon: float, count: int, start_km: float = 25.0) -> np.ndarray:
+        """Row mask of the count profiles closest to a point"""
+        total = len(self.row_cells)
+        if count <= 0 or total == 0:
+            return np.zeros(self.size, dtype=bool)
+
+        # Grow the search circle until it holds enough rows
+        point = to_unit_vector(lat, lon)
+        radius_km = start_km
+        while True:
+            rows = self._candidate_rows(lat, lon, radius_km)
+            closeness = self.units[rows] @ point
+            inside = closeness >= math.cos(min(radius_km / EARTH_RADIUS_KM, math.pi))
+            if inside.sum() >= min(count, total) or radius_km >= math.pi * EARTH_RADIUS_KM:
+                break
+            radius_km *= 2
+
+        rows, closeness = rows[inside], closeness[inside]
+        mask = np.zeros(self.size, dtype=bool)
+        count = min(count, len(rows))
+        if count == 0:
+            return mask
+        mask[rows[np.argpartition(-closeness, count - 1)[:count]]] = True
+        return mask
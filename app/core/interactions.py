@@ -0,0 +1,337 @@
+#interactions.py
+"""Interaction events (likes, passes, openers sent) and the preferences learned from them.
+
+Events are buffered in memory and written behind the request path by a
+flusher thread, one write() per batch into append-only segment files. The
+OS page cache absorbs the writes; the log is fsynced only when a segment is
+sealed and at shutdown, so a crash can lose the last unflushed batch.
+"""
+
+from typing import Dict, Any, List, Iterator, Optional, Tuple
+from pathlib import Path
+import os
+import threading
+import time
+import logging
+
+import numpy as np
+
+from app.core.errors import Overloaded
+from app.core.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+
+class InteractionBacklogFull(Overloaded):
+    """The flusher is too far behind to accept more events"""
+
+    def __init__(self, pending: int):
+        super().__init__(f"Interaction backlog full ({pending} events pending)")
+
+class InteractionLog:
+    """Append-only, segmented event log with batched write-behind"""
+
+    def __init__(
+        self,
+        log_dir: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        flush_interval: float = 0.2,
+        max_pending: int = 1000000
+    ):
+        self.log_dir = Path(log_dir)
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.appended = 0
+        self.written = 0
+        self.segment = 0
+        # Segment number -> number of the first event in it, so replay can start mid-log
+        self.segment_starts: Dict[int, int] = {}
+        self._size = 0
+        self._file = None
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.log_dir.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+
+    def _segment_path(self, number: int) -> Path:
+        return self.log_dir / f"{SEGMENT_PREFIX}{number:08d}{SEGMENT_SUFFIX}"
+
+    @staticmethod
+    def _segment_number(path: Path) -> int:
+        return int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def open(self):
+        """Count existing events, repair a torn tail and start the flusher"""
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        segments = self._segments()
+        for path in segments:
+            self.segment_starts[self._segment_number(path)] = self.appended
+            with open(path, 'rb') as file:
+                self.appended += sum(chunk.count(b'\n') for chunk in iter(lambda: file.read(1 << 20), b''))
+        self.written = self.appended
+
+        if segments:
+            self.segment = self._segment_number(segments[-1])
+            self._truncate_partial(segments[-1])
+        self.segment_starts.setdefault(self.segment, self.appended)
+        self._file = open(self._segment_path(self.segment), 'ab')
+        self._size = self._file.tell()
+
+        self._thread = threading.Thread(target=self._run, name="interaction-log-flusher", daemon=True)
+        self._thread.start()
+        logger.info(f"Interaction log {self.log_dir}: {self.appended} events in {len(segments)} segments")
+
+    @staticmethod
+    def _truncate_partial(path: Path):
+        """Drop a record cut off by a crash so new appends start on a fresh line"""
+        size = path.stat().st_size
+        if size == 0:
+            return
+        with open(path, 'rb+') as file:
+            file.seek(max(0, size - (1 << 16)))
+            tail = file.read()
+            if tail.endswith(b'\n'):
+                return
+            keep = size - len(tail) + tail.rfind(b'\n') + 1
+            file.truncate(keep)
+            logger.warning(f"Truncated partial interaction record at the end of {path}")
+
+    def append(self, events: List[Dict[str, Any]]) -> int:
+        """Queue events for the flusher; never touches the disk"""
+        with self._lock:
+            if len(self._pending) + len(events) > self.max_pending:
+                raise InteractionBacklogFull(len(self._pending))
+            self._pending.extend(events)
+            self.appended += len(events)
+            return self.appended
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Interaction log flush failed: {e}")
+
+    def flush(self) -> int:
+        """Write everything queued so far as one batch; returns the number of events on disk"""
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                data = b''.join(dumps(event) + b'\n' for event in batch)
+                if self._size > 0 and self._size + len(data) > self.segment_bytes:
+                    self._rotate()
+                self._file.write(data)
+                self._file.flush()
+                self._size += len(data)
+                self.written += len(batch)
+            return self.written
+
+    def _rotate(self):
+        """Seal the current segment (the only fsync besides shutdown) and start the next one"""
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self.segment += 1
+        self.segment_starts[self.segment] = self.written
+        self._file = open(self._segment_path(self.segment), 'ab')
+        self._size = 0
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._file is not None:
+            self.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def replay(self, start: int = 0, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Events on disk in append order, from event number start up to limit"""
+        segments = self._segments()
+        starts = [self.segment_starts.get(self._segment_number(path), 0) for path in segments]
+        for i, path in enumerate(segments):
+            if i + 1 < len(segments) and starts[i + 1] <= start:
+                # Segment lies entirely before start
+                continue
+            count = starts[i]
+            with open(path, 'rb') as file:
+                for line in file:
+                    if limit is not None and count >= limit:
+                        return
+                    if not line.endswith(b'\n'):
+                        # Tail still being written
+                        return
+                    count += 1
+                    if count <= start:
+                        continue
+                    try:
+                        event = loads(line)
+                    except ValueError:
+                        logger.warning(f"Skipping unreadable interaction record in {path}")
+                        continue
+                    yield event
+
+    @property
+    def is_open(self) -> bool:
+        return self._file is not None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "appended": self.appended,
+            "written": self.written,
+            "pending": len(self._pending),
+            "segment": self.segment,
+        }
+
+class PreferenceStore:
+    """Per-user preference vectors, row-aligned with the profile embeddings"""
+
+    def __init__(self, count: int, decay: float = 0.98):
+        self.decay = decay
+        self.counts = np.zeros(count, dtype=np.int64)
+        # Only users who interacted get a vector: row -> slot, -1 for none yet
+        self.slots = np.full(count, -1, dtype=np.int64)
+        self.vectors: Optional[np.ndarray] = None
+        self.active = 0
+
+    def resize(self, count: int):
+        """Grow with the corpus; new users start without preferences"""
+        extra = count - len(self.counts)
+        if extra <= 0:
+            return
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+        self.slots = np.concatenate([self.slots, np.full(extra, -1, dtype=np.int64)])
+
+    def _assign_slots(self, rows: np.ndarray, dim: int) -> np.ndarray:
+        """Slots of the given (unique) rows, allocating vectors for first-time actors"""
+        new_rows = rows[self.slots[rows] < 0]
+        self.slots[new_rows] = np.arange(self.active, self.active + len(new_rows))
+        self.active += len(new_rows)
+
+        capacity = 0 if self.vectors is None else len(self.vectors)
+        if self.active > capacity:
+            grown = np.zeros((max(self.active, 2 * capacity, 1024), dim), dtype=np.float32)
+            if self.vectors is not None:
+                grown[:capacity] = self.vectors
+            self.vectors = grown
+        return self.slots[rows]
+
+    def apply(
+        self,
+        actor_rows: np.ndarray,
+        target_vectors: np.ndarray,
+        weights: np.ndarray,
+        target_index: Optional[np.ndarray] = None
+    ):
+        """Move each actor's vector towards (or away from) the profiles they engaged with, decaying older ones"""
+        # Event i uses target_vectors[target_index[i]], so each engaged profile is decoded once per batch
+        actor_rows = np.asarray(actor_rows, dtype=np.int64)
+        if len(actor_rows) == 0:
+            return
+        weights = np.asarray(weights, dtype=np.float32)
+        if target_index is None:
+            target_index = np.arange(len(actor_rows))
+
+        order = np.argsort(actor_rows, kind='stable')
+        touched, starts, per_actor = np.unique(actor_rows[order], return_index=True, return_counts=True)
+        slots = self._assign_slots(touched, target_vectors.shape[1])
+        self.vectors[slots] *= (self.decay ** per_actor)[:, None].astype(np.float32)
+
+        # Most actors have one event per batch: add those in one vectorized step, sum the rest per actor
+        single = per_actor == 1
+        events = order[starts[single]]
+        self.vectors[slots[single]] += weights[events, None] * target_vectors[target_index[events]]
+        for slot, start, count in zip(slots[~single], starts[~single], per_actor[~single]):
+            events = order[start:start + count]
+            self.vectors[slot] += weights[events] @ target_vectors[target_index[events]]
+
+        self.counts[touched] += per_actor
+
+    def get(self, row: int, min_interactions: int = 1) -> Optional[np.ndarray]:
+        """Preference vector of a user, or None until they have interacted enough"""
+        if row >= len(self.counts) or self.counts[row] < min_interactions or self.slots[row] < 0:
+            return None
+        vector = self.vectors[self.slots[row]]
+        return vector.copy() if np.any(vector) else None
+
+    def save(self, path: Path, users: List[Dict[str, Any]], applied: int, index_key: str):
+        """Write the vectors of users with preferences, keyed by user id, replacing any earlier snapshot"""
+        rows = np.flatnonzero(self.slots >= 0)
+        vectors = self.vectors[self.slots[rows]] if len(rows) else np.zeros((0, 0), dtype=np.float32)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as file:
+            np.savez(
+                file,
+                ids=np.array([str(users[row].get('id')) for row in rows]),
+                counts=self.counts[rows],
+                vectors=vectors,
+                applied=applied,
+                index_key=index_key
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+        cls,
+        path: Path,
+        user_rows: Dict[str, int],
+        count: int,
+        decay: float,
+        index_key: str
+    ) -> Optional[Tuple["PreferenceStore", int]]:
+        """Snapshot taken for the same index, with the number of logged events it covers"""
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            if str(data['index_key']) != index_key:
+                return None
+            rows = np.array([user_rows.get(user_id, -1) for user_id in data['ids'].tolist()], dtype=np.int64)
+            known = rows >= 0
+            store = cls(count, decay)
+            if known.any():
+                slots = store._assign_slots(rows[known], data['vectors'].shape[1])
+                store.vectors[slots] = data['vectors'][known]
+                store.counts[rows[known]] = data['counts'][known]
+            return store, int(data['applied'])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users_with_preferences": self.active,
+            "interactions_applied": int(self.counts.sum()),
+        }
+
+def event_rows(
+    events: List[Dict[str, Any]],
+    user_rows: Dict[str, int],
+    action_weights: Dict[str, float]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(actor rows, target rows, weights) of the events whose users and action are known"""
+    actors, targets, weights = [], [], []
+    for event in events:
+        actor = user_rows.get(event.get('user_id'))
+        target = user_rows.get(event.get('target_id'))
+        weight = action_weights.get(event.get('action'))
+        if actor is None or target is None or weight is None:
+            continue
+        actors.append(actor)
+        targets.append(target)
+        weights.append(weight)
+    return (
+        np.array(actors, dtype=np.int64),
+        np.array(targets, dtype=np.int64),
+        np.array(weights, dtype=np.float32)
+    )
+
+def new_event(user_id: str, target_id: str, action: str, timestamp: Optional[float] = None) -> Dict[str, Any]:
+    """Log record of one interaction, stamped with the receive time by default"""
+    return {'ts': timestamp if timestamp is not None else time.time(), 'user_id': user_id, 'target_id': target_id, 'action': action}
@@ -0,0 +1,218 @@
+#profiling.py
+"""Event-loop stall detection and a sampling profiler for the live process.
+
+Both work from plain Python threads reading sys._current_frames(), so they
+see exactly what the event loop thread is executing while it is blocked,
+and they need no extra dependencies or restart. Stacks are reported in the
+collapsed ("folded") format read by flamegraph.pl, speedscope and inferno.
+"""
+
+from typing import Dict, Any, List, Optional, Set
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+import asyncio
+import os
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_BASE_DIR = str(Path(__file__).resolve().parent.parent.parent) + os.sep
+
+# Leaf frames of threads that are waiting rather than working
+IDLE_FRAMES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+    ('connection.py', '_recv'),
+    ('connection.py', 'poll'),
+}
+
+_profile_lock = threading.Lock()
+
+def frame_name(frame) -> str:
+    """Function name and defining location, stable across samples of the same function"""
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_BASE_DIR):
+        filename = filename[len(_BASE_DIR):]
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+def stack_frames(frame) -> List[str]:
+    """Frames from the outermost call to the innermost"""
+    frames = []
+    while frame is not None:
+        frames.append(frame_name(frame))
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+def is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+def collapsed(counts: Counter) -> str:
+    """Folded stacks, one 'frame;frame;frame count' line each"""
+    return ''.join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+def sample_stacks(
+    duration: float,
+    interval: float = 0.005,
+    thread_ids: Optional[Set[int]] = None,
+    include_idle: bool = False
+) -> Dict[str, Any]:
+    """Sample the stacks of every thread (or the given ones) for duration seconds"""
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+
+    try:
+        me = threading.get_ident()
+        counts: Counter = Counter()
+        samples = 0
+        start = time.perf_counter()
+        deadline = start + duration
+
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (thread_ids is not None and ident not in thread_ids):
+                    continue
+                if not include_idle and is_idle(frame):
+                    continue
+                thread_name = names.get(ident, f"thread-{ident}").replace(';', ':')
+                counts[';'.join([thread_name] + stack_frames(frame))] += 1
+            samples += 1
+            time.sleep(interval)
+
+        return {
+            'samples': samples,
+            'duration': time.perf_counter() - start,
+            'stacks': counts,
+        }
+    finally:
+        _profile_lock.release()
+
+class LoopMonitor:
+    """Watchdog thread that records event-loop stalls with the stack that caused them"""
+
+    def __init__(self, threshold_ms: float = 100.0, interval_ms: float = 20.0, history: int = 100):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.stalls: deque = deque(maxlen=history)
+        self.loop_thread_id: Optional[int] = None
+        self.thread_ident: Optional[int] = None
+
+        self.beats = 0
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.stalled_seconds = 0.0
+        self._beat = time.monotonic()
+        self._current: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the heartbeat on the running loop and the watchdog thread"""
+        self.loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        thread.start()
+        self.thread_ident = thread.ident
+        logger.info(f"Loop monitor recording stalls above {self.threshold * 1000:.0f}ms")
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        """Tick on the loop; a late tick is loop lag"""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+
+            with self._lock:
+                self._beat = now
+                self.beats += 1
+                self.max_lag = max(self.max_lag, lag)
+                stall, self._current = self._current, None
+                if stall is not None:
+                    stall['duration_ms'] = round(lag * 1000, 1)
+                    self.stalled_seconds += lag
+
+            if stall is not None:
+                logger.warning(f"Event loop stalled for {stall['duration_ms']}ms in {stall['stack'][-1] if stall['stack'] else '?'}")
+
+    def _watch(self):
+        """Sample the loop thread's stack while its heartbeat is overdue"""
+        while not self._stop.wait(self.interval / 2):
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue < self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            frames = stack_frames(frame)
+
+            with self._lock:
+                overdue = time.monotonic() - self._beat - self.interval
+                if overdue < self.threshold:
+                    # The loop caught up while the stack was being captured
+                    continue
+                if self._current is None:
+                    self._current = {
+                        'started': datetime.fromtimestamp(time.time() - overdue).isoformat(),
+                        'duration_ms': None,
+                        'stack': frames,
+                        'samples': Counter(),
+                    }
+                    self.stalls.append(self._current)
+                    self.stall_count += 1
+                # Long stalls are sampled repeatedly, so the folded stacks show where the time went
+                self._current['samples'][';'.join(frames)] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Lag summary without the recorded stacks"""
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'max_lag_ms': round(self.max_lag * 1000, 1),
+            'stalls': self.stall_count,
+            'stalled_ms': round(self.stalled_seconds * 1000, 1),
+            'current_stall': self._current is not None,
+        }
+
+    def recent_stalls(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent stalls first, each with its stack and folded samples"""
+        with self._lock:
+            stalls = list(self.stalls)[-limit:]
+            return [
+                {
+                    'started': stall['started'],
+                    'duration_ms': stall['duration_ms'],
+                    'stack': list(stall['stack']),
+                    'collapsed': collapsed(stall['samples']),
+                }
+                for stall in reversed(stalls)
+            ]
+
+    def collapsed_stalls(self) -> str:
+        """Folded stacks of all recorded stalls, for one flamegraph of everything that blocked the loop"""
+        with self._lock:
+            counts: Counter = Counter()
+            for stall in self.stalls:
+                counts.update(stall['samples'])
+        return collapsed(counts)
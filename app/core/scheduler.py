@@ -0,0 +1,230 @@
+#scheduler.py
+
+from typing import Dict, Any, Optional, Callable, List
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import asyncio
+import heapq
+import itertools
+import os
+import time
+import logging
+
+from app.core.errors import ServiceError, Overloaded
+
+logger = logging.getLogger(__name__)
+
+class WorkloadRejected(Overloaded):
+    """Queue for a workload class is full, the request is shed"""
+
+    def __init__(self, workload: str, retry_after: int = 1):
+        super().__init__(f"Server busy: {workload} queue is full", retry_after)
+
+class DeadlineExceeded(ServiceError):
+    """Work did not finish before the request deadline"""
+
+    def __init__(self, workload: str):
+        super().__init__(f"Deadline exceeded for {workload} work")
+
+class ClientDisconnected(ServiceError):
+    """Client went away before queued work started"""
+
+    def __init__(self):
+        super().__init__("Client disconnected")
+
+@dataclass
+class WorkloadConfig:
+    """Limits of one workload class; lower priority values are served first"""
+    name: str
+    priority: int
+    max_workers: int
+    max_queue: int
+    timeout: float
+
+@dataclass
+class WorkloadContext:
+    """Workload class, deadline and cancellation state of the current request"""
+    workload: str
+    deadline: Optional[float] = None
+    jobs: List["Job"] = field(default_factory=list)
+    disconnected: bool = False
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def cancel(self) -> int:
+        """Client disconnected: drop everything still pending for this request"""
+        self.disconnected = True
+        dropped = 0
+        for job in self.jobs:
+            if not job.future.done():
+                job.future.set_exception(ClientDisconnected())
+                dropped += 1
+        return dropped
+
+@dataclass(order=True)
+class Job:
+    priority: int
+    seq: int
+    workload: str = field(compare=False)
+    fn: Callable = field(compare=False)
+    args: tuple = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+_current_workload: ContextVar[Optional[WorkloadContext]] = ContextVar("current_workload", default=None)
+_scheduler: Optional["WorkloadScheduler"] = None
+
+class WorkloadScheduler:
+    """Priority scheduler over separate bounded executors per workload class"""
+
+    def __init__(self, workloads: List[WorkloadConfig], cpu_slots: int = 0):
+        self.workloads: Dict[str, WorkloadConfig] = {w.name: w for w in workloads}
+        self.executors: Dict[str, ThreadPoolExecutor] = {
+            w.name: ThreadPoolExecutor(max_workers=w.max_workers, thread_name_prefix=f"{w.name}-worker")
+            for w in workloads
+        }
+        self.cpu_slots = cpu_slots or self.default_cpu_slots(workloads)
+        self.pending: List[Job] = []
+        self.queued: Dict[str, int] = {w.name: 0 for w in workloads}
+        self.running: Dict[str, int] = {w.name: 0 for w in workloads}
+        self.shed: Dict[str, int] = {w.name: 0 for w in workloads}
+        self.expired: Dict[str, int] = {w.name: 0 for w in workloads}
+        self._seq = itertools.count()
+
+    @staticmethod
+    def default_cpu_slots(workloads: List[WorkloadConfig]) -> int:
+        """Enough slots for every class but the lowest priority one, so background work only gets what is left"""
+        lowest = max(w.priority for w in workloads)
+        interactive = sum(w.max_workers for w in workloads if w.priority < lowest)
+        return max(1, min(os.cpu_count() or 1, interactive or sum(w.max_workers for w in workloads)))
+
+    @classmethod
+    def from_settings(cls, settings) -> "WorkloadScheduler":
+        """Build the search, chat and batch workload classes from settings"""
+        return cls([
+            WorkloadConfig("search", 0, settings.search_workers, settings.search_queue_limit, settings.search_timeout_s),
+            WorkloadConfig("chat", 1, settings.chat_workers, settings.chat_queue_limit, settings.chat_timeout_s),
+            WorkloadConfig("batch", 2, settings.batch_workers, settings.batch_queue_limit, settings.batch_timeout_s),
+        ], settings.scheduler_cpu_slots)
+
+    async def run(self, workload: str, fn: Callable, *args, context: Optional[WorkloadContext] = None) -> Any:
+        """Queue fn on the workload's executor and wait for it within the deadline"""
+        config = self.workloads[workload]
+        if context is not None and context.disconnected:
+            raise ClientDisconnected()
+
+        if self.queued[workload] >= config.max_queue:
+            self._prune()
+        if self.queued[workload] >= config.max_queue:
+            self.shed[workload] += 1
+            logger.warning(f"Shedding {workload} work: {self.queued[workload]} queued")
+            raise WorkloadRejected(workload)
+
+        loop = asyncio.get_running_loop()
+        job = Job(config.priority, next(self._seq), workload, fn, args, loop.create_future())
+        if context is not None:
+            context.jobs.append(job)
+        heapq.heappush(self.pending, job)
+        self.queued[workload] += 1
+        self._dispatch()
+
+        timeout = context.remaining() if context is not None else config.timeout
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout=max(timeout, 0) if timeout is not None else None)
+        except asyncio.TimeoutError:
+            self.expired[workload] += 1
+            if not job.future.done():
+                job.future.cancel()
+            raise DeadlineExceeded(workload)
+        except asyncio.CancelledError:
+            if not job.future.done():
+                job.future.cancel()
+            raise
+
+    def _dispatch(self):
+        """Start the most urgent runnable jobs while CPU slots are free"""
+        skipped = []
+        while self.pending and sum(self.running.values()) < self.cpu_slots:
+            job = heapq.heappop(self.pending)
+            if job.future.done():
+                # Timed out or client disconnected while queued
+                self.queued[job.workload] -= 1
+                continue
+            if self.running[job.workload] >= self.workloads[job.workload].max_workers:
+                skipped.append(job)
+                continue
+
+            self.queued[job.workload] -= 1
+            self.running[job.workload] += 1
+            work = asyncio.get_running_loop().run_in_executor(self.executors[job.workload], job.fn, *job.args)
+            work.add_done_callback(lambda done, job=job: self._finish(job, done))
+
+        for job in skipped:
+            heapq.heappush(self.pending, job)
+
+    def _prune(self):
+        """Drop queued jobs whose caller already gave up"""
+        live = []
+        for job in self.pending:
+            if job.future.done():
+                self.queued[job.workload] -= 1
+            else:
+                live.append(job)
+        heapq.heapify(live)
+        self.pending = live
+
+    def _finish(self, job: Job, done: asyncio.Future):
+        self.running[job.workload] -= 1
+        if not job.future.done():
+            if done.cancelled():
+                job.future.cancel()
+            elif done.exception() is not None:
+                job.future.set_exception(done.exception())
+            else:
+                job.future.set_result(done.result())
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Queue depth, running jobs and rejections per workload class"""
+        return {
+            name: {
+                "queued": self.queued[name],
+                "running": self.running[name],
+                "shed": self.shed[name],
+                "expired": self.expired[name],
+            }
+            for name in self.workloads
+        }
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def set_scheduler(scheduler: Optional[WorkloadScheduler]):
+    """Install the process-wide scheduler used by run_in_workload"""
+    global _scheduler
+    _scheduler = scheduler
+
+async def run_in_workload(fn: Callable, *args) -> Any:
+    """Run blocking work for the current request's workload class, or on the default executor"""
+    context = _current_workload.get()
+    if _scheduler is None or context is None:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, fn, *args)
+    return await _scheduler.run(context.workload, fn, *args, context=context)
+
+@contextmanager
+def workload_context(name: str, timeout: Optional[float] = None):
+    """Run the enclosed work as the given workload class, within timeout seconds if given"""
+    context = WorkloadContext(name, time.monotonic() + timeout if timeout is not None else None)
+    token = _current_workload.set(context)
+    try:
+        yield context
+    finally:
+        _current_workload.reset(token)
+
+def workload_timeout(name: str) -> Optional[float]:
+    """Configured deadline of a workload class, if a scheduler is installed"""
+    return _scheduler.workloads[name].timeout if _scheduler is not None else None
@@ -0,0 +1,68 @@
+#serialization.py
+
+from typing import Dict, Any, Iterable
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_KEYS = (
+    'id', 'name', 'age', 'location', 'interests', 'profession',
+    'education', 'relationship_type', 'bio', 'preferences'
+)
+
+def dumps(obj: Any) -> bytes:
+    """Encode to compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+
+def loads(data: bytes) -> Any:
+    """Decode JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def result_fields(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Static part of a search result (everything except the scores)"""
+    bio = user.get('bio', '')
+    return {
+        'id': user.get('id'),
+        'name': user.get('name'),
+        'age': user.get('age'),
+        'location': user.get('location'),
+        'profession': user.get('profession'),
+        'interests': user.get('interests', [])[:3],
+        'bio': bio[:100] + ('...' if len(bio) > 100 else ''),
+        'relationship_type': user.get('relationship_type'),
+    }
+
+def profile_fragment(user: Dict[str, Any]) -> bytes:
+    """Pre-serialized UserProfile object"""
+    return dumps({key: user.get(key) for key in PROFILE_KEYS})
+
+def result_prefix(user: Dict[str, Any]) -> bytes:
+    """Pre-serialized search result left open for the per-query scores"""
+    return dumps(result_fields(user))[:-1]
+
+def result_fragment(prefix: bytes, score: float) -> bytes:
+    """Close a result prefix with its similarity score and match percentage"""
+    return b''.join((
+        prefix,
+        b',"similarity_score":', dumps(float(score)),
+        b',"match_percentage":', str(int(score * 100)).encode('ascii'),
+        b'}'
+    ))
+
+def json_array(fragments: Iterable[bytes]) -> bytes:
+    """Join pre-serialized JSON values into an array"""
+    return b'[' + b','.join(fragments) + b']'
+
+def json_object(fields: Dict[str, bytes]) -> bytes:
+    """Join pre-serialized JSON values into an object"""
+    return b'{' + b','.join(dumps(key) + b':' + value for key, value in fields.items()) + b'}'
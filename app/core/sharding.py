@@ -0,0 +1,478 @@
+#sharding.py
+"""Scatter-gather profile search over shard processes.
+
+Profiles are partitioned by row (row % shard_count) and every shard runs the
+filter and similarity stages on its own slice, on its own core. The
+coordinator fans the weighted query out and merges the per-shard top-k.
+LocalShard serves a shard from a child process; a shard on another node only
+needs the same async request(op, payload, timeout) method.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass, field
+import asyncio
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import logging
+
+import numpy as np
+
+from app.core.errors import Overloaded
+from app.core.embedding_store import EmbeddingStore
+from app.core.geo import Gazetteer, GeoIndex
+from app.core.tasks import FilterTask
+
+logger = logging.getLogger(__name__)
+
+class ShardError(Exception):
+    """A shard failed, timed out or is not running"""
+
+class ShardsUnavailable(Overloaded):
+    """No shard answered, so there is nothing to merge"""
+
+    def __init__(self, detail: str = "No search shard is available"):
+        super().__init__(detail)
+
+@dataclass
+class ShardData:
+    """One generation of a shard's slice: profiles, vectors and geo index of rows shard_id, shard_id + shard_count, ..."""
+    shard_id: int
+    shard_count: int
+    users: List[Dict[str, Any]]
+    store: EmbeddingStore
+    combined: EmbeddingStore
+    geo_index: GeoIndex
+
+    def global_rows(self, positions: np.ndarray) -> np.ndarray:
+        return np.asarray(positions, dtype=np.int64) * self.shard_count + self.shard_id
+
+    def positions(self, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(rows, dtype=np.int64) // self.shard_count
+
+@dataclass
+class ShardResults:
+    """Merged top-k of all shards that answered"""
+    rows: np.ndarray
+    scores: np.ndarray
+    vectors: Optional[np.ndarray]
+    matched: int
+    failed: List[int] = field(default_factory=list)
+
+def build_shard(
+    shard_id: int,
+    shard_count: int,
+    users: List[Dict[str, Any]],
+    vectors: np.ndarray,
+    combined: np.ndarray,
+    store_kwargs: Dict[str, Any],
+    gazetteer: Gazetteer
+) -> ShardData:
+    """Pack a slice of field and precombined vectors and index its locations"""
+    store = EmbeddingStore(**store_kwargs)
+    combined_store = EmbeddingStore(**store_kwargs)
+    if users:
+        store.build(vectors, normalize=False)
+        combined_store.build(combined, normalize=False)
+    geo_index = GeoIndex(gazetteer)
+    geo_index.build([user.get('location', '') for user in users])
+    return ShardData(shard_id, shard_count, users, store, combined_store, geo_index)
+
+def update_shard(
+    shard: ShardData,
+    rows: np.ndarray,
+    users: List[Dict[str, Any]],
+    vectors: np.ndarray,
+    combined: np.ndarray
+):
+    """Replace or append global rows of a slice in place; new rows come in ascending order"""
+    if len(rows) == 0:
+        return
+
+    positions = shard.positions(rows)
+    for position, user in zip(positions, users):
+        if position < len(shard.users):
+            shard.users[position] = user
+        else:
+            shard.users.append(user)
+        shard.geo_index.update(int(position), user.get('location', ''))
+    shard.store.set_rows(positions, vectors, normalize=False)
+    shard.combined.set_rows(positions, combined, normalize=False)
+
+def search_shard(shard: ShardData, request: Dict[str, Any]) -> Dict[str, Any]:
+    """Filter and score one slice, returning its top-k by global row id"""
+    empty = {'rows': np.zeros(0, dtype=np.int64), 'scores': np.zeros(0, dtype=np.float32), 'matched': 0}
+    if not shard.users:
+        return empty
+
+    mask = FilterTask.mask(shard.users, request['filters'], shard.geo_index, request['default_radius_km'])
+    indices = np.flatnonzero(mask)
+    if len(indices) == 0:
+        return empty
+
+    store = shard.combined if request.get('combined') else shard.store
+    scores = store.scores(request['query'], indices, False)
+    k = min(request['k'], len(indices))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+
+    result = {'rows': shard.global_rows(indices[top]), 'scores': scores[top], 'matched': len(indices)}
+    if request.get('vectors'):
+        result['vectors'] = store.decode(indices[top])
+    return result
+
+def _shard_main(shard_id: int, conn, store_kwargs: Dict[str, Any], gazetteer_path: Optional[str]):
+    """Serve load, update, search, vectors and drop requests for one shard until the pipe closes"""
+    gazetteer = Gazetteer(gazetteer_path)
+    generations: Dict[int, ShardData] = {}
+
+    while True:
+        try:
+            request_id, op, payload = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        try:
+            if op == 'search':
+                result = search_shard(generations[payload['generation']], payload)
+            elif op == 'load':
+                generations[payload['generation']] = build_shard(
+                    shard_id, payload['shard_count'], payload['users'], payload['vectors'], payload['combined'],
+                    store_kwargs, gazetteer
+                )
+                result = len(payload['users'])
+            elif op == 'update':
+                update_shard(
+                    generations[payload['generation']], payload['rows'], payload['users'], payload['vectors'], payload['combined']
+                )
+                result = len(payload['rows'])
+            elif op == 'vectors':
+                shard = generations[payload['generation']]
+                result = shard.combined.decode(shard.positions(payload['rows']))
+            elif op == 'drop':
+                generations.pop(payload['generation'], None)
+                result = sorted(generations)
+            elif op == 'ping':
+                result = os.getpid()
+            else:
+                raise ValueError(f"Unknown shard operation: {op}")
+            conn.send((request_id, True, result))
+        except KeyError as e:
+            conn.send((request_id, False, f"generation {e} is not loaded"))
+        except Exception as e:
+            conn.send((request_id, False, f"{type(e).__name__}: {e}"))
+
+class LocalShard:
+    """Shard served by a local child process, with concurrent requests multiplexed over one pipe"""
+
+    def __init__(self, shard_id: int, store_kwargs: Dict[str, Any], gazetteer_path: Optional[str] = None):
+        self.shard_id = shard_id
+        self.store_kwargs = store_kwargs
+        self.gazetteer_path = gazetteer_path
+        self.process = None
+        self.conn = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._send_lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        """Spawn the shard process and the thread reading its replies"""
+        context = multiprocessing.get_context('spawn')
+        parent, child = context.Pipe()
+        self.process = context.Process(
+            target=_shard_main,
+            args=(self.shard_id, child, self.store_kwargs, self.gazetteer_path),
+            name=f"search-shard-{self.shard_id}",
+            daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.conn = parent
+        self.loop = asyncio.get_running_loop()
+        threading.Thread(target=self._read, args=(parent,), name=f"shard-{self.shard_id}-reader", daemon=True).start()
+
+    def stop(self):
+        if self.conn is not None:
+            self.conn.close()
+        if self.process is not None:
+            self.process.join(timeout=1)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.process = None
+        self.conn = None
+
+    def _read(self, conn):
+        while True:
+            try:
+                request_id, ok, result = conn.recv()
+            except (EOFError, OSError):
+                break
+            self._call_soon(self._resolve, request_id, ok, result)
+        self._call_soon(self.fail_pending, conn)
+
+    def _call_soon(self, callback, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Event loop already closed during shutdown
+            pass
+
+    def _resolve(self, request_id: int, ok: bool, result: Any):
+        future = self.pending.pop(request_id, None)
+        if future is None or future.done():
+            # Caller already timed out
+            return
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(ShardError(f"Shard {self.shard_id}: {result}"))
+
+    def fail_pending(self, conn=None):
+        """Fail requests waiting on a process that exited (or on any process when conn is None)"""
+        if conn is not None and conn is not self.conn:
+            # Reader of a process that was already replaced
+            return
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ShardError(f"Shard {self.shard_id} exited"))
+        self.pending.clear()
+
+    def _send(self, conn, message: tuple):
+        with self._send_lock:
+            conn.send(message)
+
+    async def request(self, op: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """Send one request and wait for its reply"""
+        if not self.alive:
+            raise ShardError(f"Shard {self.shard_id} is not running")
+
+        loop = asyncio.get_running_loop()
+        request_id = next(self._ids)
+        future = loop.create_future()
+        self.pending[request_id] = future
+        try:
+            # Sending can block on a full pipe, so keep it off the event loop
+            await loop.run_in_executor(None, self._send, self.conn, (request_id, op, payload))
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise ShardError(f"Shard {self.shard_id} timed out after {timeout}s")
+        except (OSError, ValueError) as e:
+            raise ShardError(f"Shard {self.shard_id} is unreachable: {e}")
+        finally:
+            self.pending.pop(request_id, None)
+            if future.done() and not future.cancelled():
+                # The process may have failed the future while the send was still raising
+                future.exception()
+
+class ShardCoordinator:
+    """Partitions profiles across shards, scatters queries and merges per-shard top-k"""
+
+    def __init__(self, shards: List[LocalShard], timeout: float = 2.0):
+        self.shards = shards
+        self.timeout = timeout
+        self.failures: Dict[int, int] = {shard.shard_id: 0 for shard in shards}
+        self.stale: set = set()
+
+    @classmethod
+    def local(cls, count: int, store_kwargs: Dict[str, Any], gazetteer_path: Optional[str] = None, timeout: float = 2.0) -> "ShardCoordinator":
+        """Coordinator over count local shard processes"""
+        return cls([LocalShard(i, store_kwargs, gazetteer_path) for i in range(count)], timeout)
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def start(self):
+        for shard in self.shards:
+            shard.start()
+        logger.info(f"Started {len(self.shards)} search shards")
+
+    def stop(self):
+        for shard in self.shards:
+            shard.stop()
+
+    def partition(self, count: int) -> List[np.ndarray]:
+        """Global row ids owned by each shard"""
+        rows = np.arange(count, dtype=np.int64)
+        return [rows[shard.shard_id::len(self.shards)] for shard in self.shards]
+
+    async def load(self, generation: int, users: List[Dict[str, Any]], vectors: np.ndarray, combined: np.ndarray):
+        """Load a new generation of the corpus; shards that fail are marked stale"""
+        start = time.perf_counter()
+        partitions = self.partition(len(users))
+        replies = await asyncio.gather(*(
+            shard.request('load', {
+                'generation': generation,
+                'shard_count': len(self.shards),
+                'users': [users[i] for i in rows],
+                'vectors': vectors[rows],
+                'combined': combined[rows],
+            })
+            for shard, rows in zip(self.shards, partitions)
+        ), return_exceptions=True)
+
+        self._mark_loaded(generation, replies)
+        logger.info(f"Loaded generation {generation} ({len(users)} profiles) on {len(self.shards)} shards in {time.perf_counter() - start:.2f}s")
+
+    async def update(
+        self,
+        generation: int,
+        rows: np.ndarray,
+        users: List[Dict[str, Any]],
+        vectors: np.ndarray,
+        combined: np.ndarray
+    ):
+        """Replace or append a few rows of a loaded generation in place, on the shards owning them"""
+        rows = np.asarray(rows, dtype=np.int64)
+        owners = rows % len(self.shards)
+        asked = [shard for shard in self.shards if np.any(owners == shard.shard_id)]
+        replies = await asyncio.gather(*(
+            shard.request('update', {
+                'generation': generation,
+                'rows': rows[owners == shard.shard_id],
+                'users': [user for user, owner in zip(users, owners) if owner == shard.shard_id],
+                'vectors': vectors[owners == shard.shard_id],
+                'combined': combined[owners == shard.shard_id],
+            }, self.timeout)
+            for shard in asked
+        ), return_exceptions=True)
+
+        for shard, reply in zip(asked, replies):
+            if isinstance(reply, BaseException):
+                # Stale: keeps serving the old rows until it is restored
+                logger.error(f"Updating generation {generation} on shard {shard.shard_id} failed: {reply}")
+                self.stale.add(shard.shard_id)
+
+    def _mark_loaded(self, generation: int, replies: List[Any]):
+        """Mark shards that failed to load a generation as stale"""
+        for shard, reply in zip(self.shards, replies):
+            if isinstance(reply, BaseException):
+                logger.error(f"Loading generation {generation} on shard {shard.shard_id} failed: {reply}")
+                self.stale.add(shard.shard_id)
+            else:
+                self.stale.discard(shard.shard_id)
+
+        if len(self.stale) == len(self.shards):
+            raise ShardsUnavailable(f"No search shard could load generation {generation}")
+
+    async def restore(
+        self,
+        shard_id: int,
+        generation: int,
+        users: List[Dict[str, Any]],
+        vectors: np.ndarray,
+        combined: np.ndarray
+    ):
+        """Restart one shard and reload its slice of the live generation"""
+        shard = self.shards[shard_id]
+        await asyncio.get_running_loop().run_in_executor(None, shard.stop)
+        shard.fail_pending()
+        shard.start()
+        await shard.request('load', {
+            'generation': generation,
+            'shard_count': len(self.shards),
+            'users': users,
+            'vectors': vectors,
+            'combined': combined,
+        })
+        self.stale.discard(shard_id)
+        logger.info(f"Restored shard {shard_id} with {len(users)} profiles")
+
+    async def drop(self, generation: int):
+        """Free a generation no in-flight search can still use"""
+        await asyncio.gather(*(
+            shard.request('drop', {'generation': generation}, self.timeout)
+            for shard in self.shards
+        ), return_exceptions=True)
+
+    async def vectors(self, generation: int, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Decoded precombined embeddings of global rows and a mask of the rows whose shard answered"""
+        rows = np.asarray(rows, dtype=np.int64)
+        owners = rows % len(self.shards)
+        # Shards owning none of the rows (or no profiles at all) are not asked
+        asked = [shard for shard in self.shards if np.any(owners == shard.shard_id)]
+        replies = await asyncio.gather(*(
+            shard.request('vectors', {'generation': generation, 'rows': rows[owners == shard.shard_id]}, self.timeout)
+            for shard in asked
+        ), return_exceptions=True)
+
+        vectors = None
+        resolved = np.zeros(len(rows), dtype=bool)
+        for shard, reply in zip(asked, replies):
+            if isinstance(reply, BaseException):
+                self.failures[shard.shard_id] += 1
+                logger.warning(f"Shard {shard.shard_id} returned no vectors: {reply}")
+                continue
+            if vectors is None:
+                vectors = np.zeros((len(rows), reply.shape[1]), dtype=np.float32)
+            vectors[owners == shard.shard_id] = reply
+            resolved[owners == shard.shard_id] = True
+        if vectors is None:
+            vectors = np.zeros((len(rows), 0), dtype=np.float32)
+        return vectors, resolved
+
+    async def search(
+        self,
+        generation: int,
+        query: np.ndarray,
+        filters: Dict[str, Any],
+        k: int,
+        vectors: bool = False,
+        default_radius_km: float = 40.0,
+        combined: bool = False
+    ) -> ShardResults:
+        """Scatter the query, then merge whatever the shards return before the timeout"""
+        request = {
+            'generation': generation,
+            'query': np.asarray(query, dtype=np.float32),
+            'filters': filters,
+            'k': k,
+            'vectors': vectors,
+            'combined': combined,
+            'default_radius_km': default_radius_km,
+        }
+        replies = await asyncio.gather(*(
+            shard.request('search', request, self.timeout) for shard in self.shards
+        ), return_exceptions=True)
+
+        parts, failed = [], []
+        for shard, reply in zip(self.shards, replies):
+            if isinstance(reply, BaseException):
+                self.failures[shard.shard_id] += 1
+                failed.append(shard.shard_id)
+                logger.warning(f"Shard {shard.shard_id} left out of search results: {reply}")
+            else:
+                parts.append(reply)
+
+        if not parts:
+            raise ShardsUnavailable()
+
+        rows = np.concatenate([part['rows'] for part in parts])
+        scores = np.concatenate([part['scores'] for part in parts])
+        top = np.argsort(-scores, kind='stable')[:k]
+        merged_vectors = np.concatenate([part['vectors'] for part in parts if 'vectors' in part])[top] if vectors and len(rows) else None
+
+        return ShardResults(
+            rows=rows[top],
+            scores=scores[top],
+            vectors=merged_vectors,
+            matched=sum(part['matched'] for part in parts),
+            failed=failed
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Liveness and failure counts per shard"""
+        return {
+            str(shard.shard_id): {
+                "alive": shard.alive,
+                "stale": shard.shard_id in self.stale,
+                "failures": self.failures[shard.shard_id],
+            }
+            for shard in self.shards
+        }
@@ -1,11 +1,28 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Callable
+from pathlib import Path
+import hashlib
+import itertools
+import os
+import threading
+import time
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import asyncio
 import logging
 
+from app.core.embedding_store import EmbeddingStore
+from app.core.geo import GeoIndex
+from app.core.scheduler import run_in_workload
+
 logger = logging.getLogger(__name__)
 
+# Field groups embedded separately so a long bio cannot drown out the rest of the profile
+PROFILE_FIELDS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    'bio': lambda u: u.get('bio', ''),
+    'interests': lambda u: ' '.join(u.get('interests', [])),
+    'career': lambda u: f"{u.get('profession', '')} {u.get('education', '')}",
+    'location': lambda u: u.get('location', ''),
+    'relationship': lambda u: u.get('relationship_type', ''),
+}
+
 class EmbeddingTask:
     """Task for generating embeddings"""
     
@@ -14,47 +31,262 @@ class EmbeddingTask:
     
     async def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """Generate embeddings for a list of texts"""
-        loop = asyncio.get_event_loop()
-        embeddings = await loop.run_in_executor(None, self.model.encode, texts)
+        embeddings = await run_in_workload(self.model.encode, texts)
         return embeddings
 
+class FieldEmbeddingTask:
+    """Task for incremental per-field profile embeddings"""
+    
+    def __init__(self, embedding_task: EmbeddingTask, model_name: str, cache_dir: Optional[str] = None):
+        self.embedding_task = embedding_task
+        self.cache_dir = Path(cache_dir) / model_name.replace('/', '__') if cache_dir else None
+        # Text hash -> vector per field, read from disk once and then kept in memory
+        self.caches: Dict[str, Dict[str, np.ndarray]] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """Cache key of a field text"""
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def field_texts(users: List[Dict], field: str) -> List[str]:
+        """Build the text of one field group for every user"""
+        extract = PROFILE_FIELDS[field]
+        return [extract(user).strip() for user in users]
+    
+    async def encode_fields(self, users: List[Dict], fields: List[str], prune: bool = False) -> Dict[str, np.ndarray]:
+        """Normalized embeddings per field, re-encoding only texts missing from the cache"""
+        # prune=True means users is the whole corpus, so entries nobody uses any more can go
+        return {field: await self._encode_field(users, field, prune) for field in fields}
+    
+    async def _encode_field(self, users: List[Dict], field: str, prune: bool = False) -> np.ndarray:
+        """Encode one field group, reusing cached vectors keyed by text hash"""
+        hashes, missing = await run_in_workload(self._lookup, users, field)
+        if missing:
+            vectors = await self.embedding_task.generate_embeddings([text for _, text in missing])
+            vectors = EmbeddingStore.normalize(vectors)
+            entries = {text_hash: vector for (text_hash, _), vector in zip(missing, vectors)}
+            await run_in_workload(self.save_entries, field, entries)
+        if prune:
+            await run_in_workload(self.prune, field, hashes)
+        
+        logger.info(f"Field '{field}': encoded {len(missing)} new texts, reused {len(hashes) - len(missing)}")
+        return await run_in_workload(self._stack, field, hashes)
+    
+    def _lookup(self, users: List[Dict], field: str) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """Text hash of every user and the (hash, text) pairs missing from the cache"""
+        texts = self.field_texts(users, field)
+        hashes = [self.text_hash(text) for text in texts]
+        with self._lock:
+            cached = self._field_cache(field)
+            missing = sorted({h: t for h, t in zip(hashes, texts) if h not in cached}.items())
+        return hashes, missing
+    
+    def _stack(self, field: str, hashes: List[str]) -> np.ndarray:
+        with self._lock:
+            cached = self._field_cache(field)
+            return np.stack([cached[h] for h in hashes]).astype(np.float32)
+    
+    def _field_cache(self, field: str) -> Dict[str, np.ndarray]:
+        """In-memory cache of a field, loaded from its segments on first use; callers hold the lock"""
+        cached = self.caches.get(field)
+        if cached is None:
+            cached = self.caches[field] = self._load_segments(field)
+        return cached
+    
+    def _segments(self, field: str) -> List[Path]:
+        if self.cache_dir is None:
+            return []
+        return sorted((self.cache_dir / field).glob("segment-*.npz"))
+    
+    def _load_segments(self, field: str) -> Dict[str, np.ndarray]:
+        """Read every cache segment of a field"""
+        cached: Dict[str, np.ndarray] = {}
+        for path in self._segments(field):
+            try:
+                with np.load(path) as data:
+                    cached.update(zip(data['hashes'].tolist(), data['vectors']))
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable embedding cache segment {path}: {e}")
+        return cached
+    
+    def save_entries(self, field: str, entries: Dict[str, np.ndarray]):
+        """Add vectors to the cache of a field, persisting only them as a new segment"""
+        with self._lock:
+            self._field_cache(field).update(entries)
+            self._write_segment(field, entries)
+    
+    def prune(self, field: str, hashes: List[str]):
+        """Keep only the given entries of a field and compact its segments into one"""
+        used = set(hashes)
+        with self._lock:
+            cached = self._field_cache(field)
+            segments = self._segments(field)
+            if len(used) == len(cached) and len(segments) <= 1:
+                return
+            
+            kept = {text_hash: cached[text_hash] for text_hash in used if text_hash in cached}
+            self.caches[field] = kept
+            written = self._write_segment(field, kept)
+            if written is not None:
+                for path in segments:
+                    path.unlink(missing_ok=True)
+        logger.info(f"Field '{field}': pruned {len(cached) - len(kept)} unused cache entries")
+    
+    def _write_segment(self, field: str, entries: Dict[str, np.ndarray]) -> Optional[Path]:
+        """Write entries as a new append-only segment; existing segments are never rewritten"""
+        if self.cache_dir is None or not entries:
+            return None
+        path = self.cache_dir / field / f"segment-{time.time_ns():020d}-{os.getpid()}.npz"
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            hashes = list(entries)
+            tmp_path = path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as file:
+                np.savez(file, hashes=np.array(hashes), vectors=np.stack([entries[h] for h in hashes]))
+            os.replace(tmp_path, path)
+            return path
+        except OSError as e:
+            logger.warning(f"Could not write embedding cache segment {path}: {e}")
+            return None
+    
+    @staticmethod
+    def combine(field_vectors: Dict[str, np.ndarray], fields: List[str]) -> np.ndarray:
+        """Lay per-field matrices side by side so one matmul scores every field"""
+        return np.hstack([field_vectors[field] for field in fields])
+    
+    @staticmethod
+    def combine_weighted(field_vectors: Dict[str, np.ndarray], fields: List[str], field_weights: np.ndarray) -> np.ndarray:
+        """Sum the per-field vectors under fixed weights, so those weights score with a single dim-sized vector"""
+        combined = np.zeros_like(field_vectors[fields[0]])
+        for field, weight in zip(fields, field_weights):
+            combined += weight * field_vectors[field]
+        return combined
+
 class FilterTask:
     """Task for filtering users based on criteria"""
     
     @staticmethod
-    async def apply_filters(users: List[Dict], filters: Dict[str, Any]) -> List[Dict]:
-        """Apply filters to user list"""
-        filtered_users = users.copy()
+    async def build_mask(
+        users: List[Dict],
+        filters: Dict[str, Any],
+        geo_index: Optional[GeoIndex] = None,
+        default_radius_km: float = 40.0,
+        count: Optional[int] = None
+    ) -> np.ndarray:
+        """Row mask of users matching the filters, computed off the event loop"""
+        return await run_in_workload(FilterTask.mask, users, filters, geo_index, default_radius_km, count)
+    
+    @staticmethod
+    def mask(
+        users: List[Dict],
+        filters: Dict[str, Any],
+        geo_index: Optional[GeoIndex] = None,
+        default_radius_km: float = 40.0,
+        count: Optional[int] = None
+    ) -> np.ndarray:
+        """Synchronous row mask over the first count users, shared with search shard processes"""
+        # Profiles may be appended while the mask is built; rows past count are not part of this search
+        count = len(users) if count is None else count
+        mask = np.ones(count, dtype=bool)
         
         if 'age_min' in filters and 'age_max' in filters:
-            filtered_users = [u for u in filtered_users 
-                            if filters['age_min'] <= u.get('age', 0) <= filters['age_max']]
+            mask &= np.fromiter(
+                (filters['age_min'] <= u.get('age', 0) <= filters['age_max'] for u in itertools.islice(users, count)),
+                dtype=bool, count=count
+            )
         
         if 'location' in filters:
-            filtered_users = [u for u in filtered_users 
-                            if filters['location'].lower() in u.get('location', '').lower()]
+            mask &= FilterTask.location_mask(users, filters, geo_index, default_radius_km, count)
         
         if 'relationship_type' in filters:
-            filtered_users = [u for u in filtered_users 
-                            if u.get('relationship_type') == filters['relationship_type']]
+            mask &= np.fromiter(
+                (u.get('relationship_type') == filters['relationship_type'] for u in itertools.islice(users, count)),
+                dtype=bool, count=count
+            )
+        
+        logger.info(f"Filtered {count} users to {int(mask.sum())} users")
+        return mask
+    
+    @staticmethod
+    def location_mask(
+        users: List[Dict],
+        filters: Dict[str, Any],
+        geo_index: Optional[GeoIndex] = None,
+        default_radius_km: float = 40.0,
+        count: Optional[int] = None
+    ) -> np.ndarray:
+        """Radius or nearest-N mask for known places, substring match otherwise"""
+        count = len(users) if count is None else count
+        location = filters['location'].lower()
+        coords = geo_index.gazetteer.lookup(location) if geo_index is not None else None
+        
+        if coords is None:
+            return np.fromiter(
+                (location in u.get('location', '').lower() for u in itertools.islice(users, count)),
+                dtype=bool, count=count
+            )
         
-        logger.info(f"Filtered {len(users)} users to {len(filtered_users)} users")
-        return filtered_users
+        if filters.get('nearest'):
+            mask = geo_index.nearest(*coords, int(filters['nearest']))[:count]
+        else:
+            mask = geo_index.within_radius(*coords, filters.get('radius_km') or default_radius_km)[:count]
+        
+        # Profiles the gazetteer cannot place still match by name
+        unlocated = np.flatnonzero(~geo_index.located_mask()[:count])
+        for row in unlocated:
+            if location in users[row].get('location', '').lower():
+                mask[row] = True
+        return mask
 
 class MatchScoringTask:
     """Task for scoring matches"""
     
     @staticmethod
-    async def calculate_similarity(query_embedding: np.ndarray, user_embeddings: np.ndarray) -> np.ndarray:
-        """Calculate cosine similarity scores"""
-        loop = asyncio.get_event_loop()
-        similarities = await loop.run_in_executor(
-            None, 
-            cosine_similarity, 
-            query_embedding.reshape(1, -1), 
-            user_embeddings
-        )
-        return similarities[0]
+    def field_weights(fields: List[str], weights: Dict[str, float]) -> np.ndarray:
+        """Per-field weights in field order, summing to one in absolute value"""
+        unknown = set(weights) - set(fields)
+        if unknown:
+            raise ValueError(f"Unknown profile fields: {', '.join(sorted(unknown))}")
+        
+        field_weights = np.array([weights.get(field, 0.0) for field in fields], dtype=np.float32)
+        total = np.abs(field_weights).sum()
+        if total == 0:
+            raise ValueError("At least one field weight must be non-zero")
+        return field_weights / total
+    
+    @staticmethod
+    def blended_query(
+        query_embedding: np.ndarray,
+        fields: List[str],
+        weights: Optional[Dict[str, float]],
+        preference: Optional[np.ndarray] = None,
+        preference_weight: float = 0.0
+    ) -> np.ndarray:
+        """Normalized query mixed with the user's preference vector, repeated per field when weights are given"""
+        query = EmbeddingStore.normalize(query_embedding)[0]
+        if preference is not None and preference_weight > 0:
+            query = (1 - preference_weight) * query + preference_weight * EmbeddingStore.normalize(preference)[0]
+        if weights is None:
+            # Scored against vectors already combined with the default weights
+            return query
+        # Scaled per field so scores stay in cosine range
+        return np.concatenate([w * query for w in MatchScoringTask.field_weights(fields, weights)])
+    
+    @staticmethod
+    async def score_fields(
+        query_embedding: np.ndarray,
+        store: EmbeddingStore,
+        fields: List[str],
+        weights: Optional[Dict[str, float]],
+        indices: Optional[np.ndarray] = None,
+        preference: Optional[np.ndarray] = None,
+        preference_weight: float = 0.0
+    ) -> np.ndarray:
+        """Weighted multi-field similarity in a single pass; weights=None scores a precombined store"""
+        query = MatchScoringTask.blended_query(query_embedding, fields, weights, preference, preference_weight)
+        return await run_in_workload(store.scores, query, indices, False)
     
     @staticmethod
     async def rank_matches(users: List[Dict], similarities: np.ndarray, top_k: int = 5) -> List[Tuple[Dict, float]]:
@@ -62,3 +294,50 @@ class MatchScoringTask:
         scored_users = list(zip(users, similarities))
         scored_users.sort(key=lambda x: x[1], reverse=True)
         return scored_users[:top_k]
+    
+    @staticmethod
+    def mmr_order(similarities: np.ndarray, candidate_vectors: np.ndarray, top_k: int, diversity_lambda: float) -> np.ndarray:
+        """Greedy maximal marginal relevance over a candidate block"""
+        count = len(similarities)
+        top_k = min(top_k, count)
+        
+        norms = np.linalg.norm(candidate_vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        unit = candidate_vectors / norms
+        pairwise = unit @ unit.T
+        
+        selected = np.empty(top_k, dtype=np.int64)
+        redundancy = np.full(count, -np.inf, dtype=np.float32)
+        available = np.ones(count, dtype=bool)
+        
+        for step in range(top_k):
+            penalty = np.where(np.isinf(redundancy), 0.0, redundancy)
+            mmr = diversity_lambda * similarities - (1 - diversity_lambda) * penalty
+            mmr[~available] = -np.inf
+            chosen = int(np.argmax(mmr))
+            selected[step] = chosen
+            available[chosen] = False
+            redundancy = np.maximum(redundancy, pairwise[chosen])
+        
+        return selected
+    
+    @staticmethod
+    async def diversify_matches(
+        users: List[Dict],
+        similarities: np.ndarray,
+        store: EmbeddingStore,
+        indices: np.ndarray,
+        top_k: int,
+        diversity_lambda: float,
+        candidates: int = 200
+    ) -> List[Tuple[Dict, float]]:
+        """Rerank the top candidates by relevance traded off against redundancy"""
+        candidates = min(candidates, len(similarities))
+        if candidates == 0:
+            return []
+        
+        pool = np.argpartition(-similarities, candidates - 1)[:candidates]
+        vectors = store.decode(indices[pool])
+        order = MatchScoringTask.mmr_order(similarities[pool], vectors, top_k, diversity_lambda)
+        
+        return [(users[i], similarities[i]) for i in pool[order]]
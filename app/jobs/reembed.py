@@ -0,0 +1,225 @@
+#reembed.py
+"""Offline blue/green re-embedding of the profile corpus.
+
+Encodes every profile field with a (new) embedding model across a process
+pool, checkpointing each chunk so an interrupted run resumes where it
+stopped, and writes a versioned index next to the live one. Running
+DatingService instances switch to it once it is activated.
+
+    python -m app.jobs.reembed --model sentence-transformers/all-mpnet-base-v2 --workers 4 --activate
+"""
+
+from typing import Dict, List, Tuple, Any
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+import multiprocessing
+import argparse
+import json
+import os
+import time
+import logging
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.embedding_index import (
+    default_version, corpus_hash, read_manifest, write_manifest, set_current_version, is_version_name
+)
+from app.core.embedding_store import EmbeddingStore
+from app.core.tasks import FieldEmbeddingTask, PROFILE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+_worker_model = None
+
+def _init_worker(model_name: str, threads: int):
+    """Load the model once per worker process"""
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+def _encode_chunk(chunk_id: int, texts: List[str], batch_size: int) -> Tuple[int, np.ndarray, float, int]:
+    """Encode one chunk; returns the busy time so throughput can be reported per core"""
+    start = time.perf_counter()
+    vectors = _worker_model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+    return chunk_id, np.asarray(vectors, dtype=np.float32), time.perf_counter() - start, os.getpid()
+
+def load_users(path: str) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def collect_work(users: List[Dict[str, Any]], fields: List[str]) -> List[Tuple[str, str, str]]:
+    """Unique (field, text hash, text) triples, in a stable order"""
+    work = {}
+    for field in fields:
+        for text in FieldEmbeddingTask.field_texts(users, field):
+            work[(field, FieldEmbeddingTask.text_hash(text))] = text
+    return [(field, text_hash, text) for (field, text_hash), text in sorted(work.items())]
+
+def clear_checkpoints(chunk_dir: Path):
+    """Remove chunk checkpoints that belong to a different run"""
+    for path in chunk_dir.glob("*.npy"):
+        path.unlink()
+
+def run(
+    model_name: str,
+    version: str = None,
+    workers: int = None,
+    chunk_size: int = 512,
+    batch_size: int = 64,
+    threads_per_worker: int = 1,
+    activate: bool = False
+) -> Dict[str, Any]:
+    """Build (or resume) a versioned index for model_name"""
+    users = load_users(settings.users_json_path)
+    fields = list(PROFILE_FIELDS)
+    version = version or default_version(model_name, users)
+    if not is_version_name(version):
+        raise ValueError(f"Index version must be a plain name, not a path: {version}")
+    workers = workers or os.cpu_count() or 1
+    index_dir = settings.embedding_index_dir
+    chunk_dir = Path(index_dir) / version / "chunks"
+
+    run_config = {
+        'model_name': model_name,
+        'fields': fields,
+        'corpus_hash': corpus_hash(users),
+        'chunk_size': chunk_size,
+    }
+    previous = read_manifest(index_dir, version)
+    changed = [key for key in run_config if previous is not None and previous.get(key) != run_config[key]]
+
+    if previous is not None and previous.get('status') == 'ready':
+        mismatched = [key for key in changed if key != 'chunk_size']
+        if mismatched:
+            raise ValueError(f"Index {version} was built with a different {', '.join(mismatched)}; use another --version")
+        logger.info(f"Index {version} is already built")
+        if activate:
+            set_current_version(index_dir, version)
+        return previous
+
+    chunk_dir.mkdir(parents=True, exist_ok=True)
+    if changed:
+        # Checkpoints are keyed by chunk index only, so they are meaningless for another model, corpus or chunking
+        logger.warning(f"Index {version}: {', '.join(changed)} changed since the interrupted run, discarding its checkpoints")
+        clear_checkpoints(chunk_dir)
+
+    manifest = {
+        'version': version,
+        **run_config,
+        'profiles': len(users),
+        'status': 'building',
+        'created_at': datetime.now().isoformat(),
+    }
+    write_manifest(index_dir, version, manifest)
+
+    work = collect_work(users, fields)
+    chunks = [work[i:i + chunk_size] for i in range(0, len(work), chunk_size)]
+    todo = [i for i in range(len(chunks)) if not (chunk_dir / f"{i:05d}.npy").exists()]
+    logger.info(f"Index {version}: {len(work)} texts in {len(chunks)} chunks, {len(chunks) - len(todo)} already done")
+
+    busy_seconds = 0.0
+    encoded = 0
+    per_worker: Dict[int, Dict[str, float]] = {}
+    start = time.perf_counter()
+
+    if todo:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(todo)),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(model_name, threads_per_worker)
+        ) as pool:
+            futures = [
+                pool.submit(_encode_chunk, i, [text for _, _, text in chunks[i]], batch_size)
+                for i in todo
+            ]
+            for future in as_completed(futures):
+                chunk_id, vectors, seconds, pid = future.result()
+                tmp_path = chunk_dir / f"{chunk_id:05d}.tmp.npy"
+                np.save(tmp_path, vectors)
+                os.replace(tmp_path, chunk_dir / f"{chunk_id:05d}.npy")
+
+                busy_seconds += seconds
+                encoded += len(vectors)
+                stats = per_worker.setdefault(pid, {'texts': 0, 'seconds': 0.0})
+                stats['texts'] += len(vectors)
+                stats['seconds'] += seconds
+                logger.info(f"Chunk {chunk_id + 1}/{len(chunks)}: {len(vectors) / seconds:.1f} texts/s on pid {pid}")
+
+    wall_seconds = time.perf_counter() - start
+
+    # Assemble per-field hash caches in the format FieldEmbeddingTask reads
+    cached: Dict[str, Dict[str, np.ndarray]] = {field: {} for field in fields}
+    for i, chunk in enumerate(chunks):
+        vectors = EmbeddingStore.normalize(np.load(chunk_dir / f"{i:05d}.npy"))
+        if len(vectors) != len(chunk):
+            raise ValueError(f"Checkpoint {i:05d}.npy has {len(vectors)} vectors for {len(chunk)} texts; rerun to re-encode it")
+        for (field, text_hash, _), vector in zip(chunk, vectors):
+            cached[field][text_hash] = vector
+
+    field_task = FieldEmbeddingTask(None, model_name, str(Path(index_dir) / version))
+    for field in fields:
+        field_task.save_entries(field, cached[field])
+
+    manifest.update({
+        'status': 'ready',
+        'completed_at': datetime.now().isoformat(),
+        'texts': len(work),
+        'throughput': {
+            'encoded_this_run': encoded,
+            'wall_seconds': round(wall_seconds, 2),
+            'texts_per_second': round(encoded / wall_seconds, 1) if encoded and wall_seconds else None,
+            'texts_per_core_second': round(encoded / busy_seconds, 1) if busy_seconds else None,
+            'threads_per_worker': threads_per_worker,
+            'workers': {
+                str(pid): round(stats['texts'] / stats['seconds'], 1)
+                for pid, stats in per_worker.items() if stats['seconds']
+            },
+        },
+    })
+    write_manifest(index_dir, version, manifest)
+    clear_checkpoints(chunk_dir)
+    chunk_dir.rmdir()
+
+    if activate:
+        set_current_version(index_dir, version)
+        logger.info(f"Activated index {version}")
+
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed the profile corpus into a new versioned index")
+    parser.add_argument("--model", default=settings.embedding_model_name, help="Embedding model to encode with")
+    parser.add_argument("--version", default=None, help="Index version name (default: model + corpus hash)")
+    parser.add_argument("--workers", type=int, default=None, help="Encoder processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=512, help="Texts per checkpointed chunk")
+    parser.add_argument("--batch-size", type=int, default=64, help="Encoder batch size")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="Torch threads per process")
+    parser.add_argument("--activate", action="store_true", help="Point CURRENT at the new index when done")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    manifest = run(
+        args.model,
+        version=args.version,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        threads_per_worker=args.threads_per_worker,
+        activate=args.activate
+    )
+
+    throughput = manifest.get('throughput', {})
+    print(f"Index {manifest['version']} ({manifest['model_name']}): {manifest['status']}")
+    print(f"  texts/s overall:   {throughput.get('texts_per_second')}")
+    print(f"  texts/s per core:  {throughput.get('texts_per_core_second')}")
+    for pid, rate in throughput.get('workers', {}).items():
+        print(f"  worker {pid}: {rate} texts/s")
+
+if __name__ == "__main__":
+    main()
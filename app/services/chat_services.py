@@ -1,13 +1,16 @@
 #chat_services.py
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
+from collections import OrderedDict
+import hashlib
+import json
 import random
 import logging
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
 import asyncio
 
 from app.core.config import settings
+from app.core.errors import ServiceError
+from app.core.scheduler import run_in_workload
 
 logger = logging.getLogger(__name__)
 
@@ -27,10 +30,15 @@ class ChatService:
             "Any book/movie/show recommendations lately?",
             "What's something you're really passionate about right now?"
         ]
+        # (user_id, personalized) -> (profile hash, opener)
+        self.opener_cache: "OrderedDict[Tuple[str, bool], Tuple[str, str]]" = OrderedDict()
     
     async def initialize(self):
         """Initialize chat service with LLM"""
         try:
+            # Heavy ML imports happen here, not when the module is imported
+            from transformers import AutoTokenizer, AutoModelForCausalLM
+            
             loop = asyncio.get_event_loop()
             
             # Load tokenizer and model
@@ -49,6 +57,8 @@ class ChatService:
             # Add padding token if not present
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
+            # Batched openers generate after the prompt, so pad on the left; set once, the tokenizer is shared
+            self.tokenizer.padding_side = 'left'
             
             logger.info(f"Chat service initialized with {settings.llm_model_name}")
             
@@ -85,6 +95,95 @@ class ChatService:
             logger.error(f"Error generating conversation starter: {e}")
             return "Hey! How's your day going?"
     
+    @staticmethod
+    def _profile_hash(user_profile: Dict[str, Any]) -> str:
+        """Content hash so cached openers go stale when the profile changes"""
+        payload = json.dumps(user_profile, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    
+    def _cache_get(self, key: Tuple[str, bool], profile_hash: str) -> Optional[str]:
+        entry = self.opener_cache.get(key)
+        if entry is None or entry[0] != profile_hash:
+            return None
+        self.opener_cache.move_to_end(key)
+        return entry[1]
+    
+    def _cache_put(self, key: Tuple[str, bool], profile_hash: str, opener: str):
+        self.opener_cache[key] = (profile_hash, opener)
+        self.opener_cache.move_to_end(key)
+        while len(self.opener_cache) > settings.opener_cache_size:
+            self.opener_cache.popitem(last=False)
+    
+    async def generate_conversation_starters(
+        self,
+        user_profiles: List[Dict[str, Any]],
+        personalized: bool = False
+    ) -> List[str]:
+        """Openers for a page of profiles, served from the cache where possible"""
+        personalized = personalized and self.model is not None and self.tokenizer is not None
+        openers: List[Optional[str]] = []
+        missing: List[int] = []
+        
+        for i, profile in enumerate(user_profiles):
+            cached = self._cache_get((profile.get('id'), personalized), self._profile_hash(profile))
+            openers.append(cached)
+            if cached is None:
+                missing.append(i)
+        
+        if missing:
+            profiles = [user_profiles[i] for i in missing]
+            if personalized:
+                fresh = await self._generate_llm_starters(profiles)
+            else:
+                fresh = [await self.generate_conversation_starter(profile) for profile in profiles]
+            
+            for i, opener in zip(missing, fresh):
+                profile = user_profiles[i]
+                openers[i] = opener
+                self._cache_put((profile.get('id'), personalized), self._profile_hash(profile), opener)
+        
+        logger.info(f"Openers: {len(user_profiles) - len(missing)} cached, {len(missing)} generated")
+        return openers
+    
+    async def _generate_llm_starters(self, user_profiles: List[Dict[str, Any]]) -> List[str]:
+        """Generate personalized openers for several profiles in one batched generate call"""
+        prompts = []
+        for profile in user_profiles:
+            interests = ', '.join(profile.get('interests', [])[:3])
+            prompts.append(
+                f"Write a friendly first message to {profile.get('name', '')}, "
+                f"a {profile.get('profession', '')} who likes {interests}.\nMessage:"
+            )
+        
+        try:
+            def generate() -> List[str]:
+                import torch
+                
+                batch = self.tokenizer(prompts, return_tensors='pt', padding=True, max_length=128, truncation=True)
+                with torch.no_grad():
+                    outputs = self.model.generate(
+                        **batch,
+                        max_new_tokens=40,
+                        temperature=0.7,
+                        do_sample=True,
+                        pad_token_id=self.tokenizer.eos_token_id
+                    )
+                new_tokens = outputs[:, batch['input_ids'].shape[1]:]
+                return self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+            
+            texts = await run_in_workload(generate)
+        except ServiceError:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating batched openers: {e}")
+            texts = [''] * len(user_profiles)
+        
+        openers = []
+        for profile, text in zip(user_profiles, texts):
+            text = text.strip().split('\n')[0][:200]
+            openers.append(text if text else await self.generate_conversation_starter(profile))
+        return openers
+    
     async def generate_response(self, message: str, context: Optional[str] = None) -> str:
         """Generate a response using the LLM"""
         if not self.model or not self.tokenizer:
@@ -94,15 +193,13 @@ class ChatService:
             # Prepare input
             input_text = f"Context: {context}\nMessage: {message}\nResponse:" if context else f"Message: {message}\nResponse:"
             
-            # Tokenize
-            inputs = self.tokenizer.encode(input_text, return_tensors='pt', max_length=512, truncation=True)
-            
-            # Generate response
-            loop = asyncio.get_event_loop()
-            with torch.no_grad():
-                outputs = await loop.run_in_executor(
-                    None,
-                    lambda: self.model.generate(
+            # Tokenize, generate and decode off the event loop
+            def generate():
+                import torch
+                
+                inputs = self.tokenizer.encode(input_text, return_tensors='pt', max_length=512, truncation=True)
+                with torch.no_grad():
+                    outputs = self.model.generate(
                         inputs,
                         max_length=inputs.shape[1] + 50,
                         num_return_sequences=1,
@@ -110,10 +207,9 @@ class ChatService:
                         do_sample=True,
                         pad_token_id=self.tokenizer.eos_token_id
                     )
-                )
+                return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
             
-            # Decode response
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            response = await run_in_workload(generate)
             
             # Extract just the response part
             if "Response:" in response:
@@ -121,6 +217,8 @@ class ChatService:
             
             return response[:200]  # Limit response length
             
+        except ServiceError:
+            raise
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             return "That's interesting! Tell me more about that."
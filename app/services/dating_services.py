@@ -0,0 +1,774 @@
+#dating_services.py
+
+import json
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+import asyncio
+import itertools
+import logging
+import time
+from pathlib import Path
+
+from app.core.config import settings
+from app.core.agents import QueryEnhancerAgent, FilterExtractorAgent
+from app.core.tasks import EmbeddingTask, FieldEmbeddingTask, FilterTask, MatchScoringTask, PROFILE_FIELDS
+from app.core.embedding_store import EmbeddingStore
+from app.core.geo import Gazetteer, GeoIndex
+from app.core.serialization import result_fields, profile_fragment, result_prefix, result_fragment, json_array
+from app.core.embedding_index import read_manifest, current_version, list_versions
+from app.core.scheduler import run_in_workload, workload_context
+from app.core.sharding import ShardCoordinator
+from app.core.interactions import InteractionLog, PreferenceStore, event_rows, new_event
+
+logger = logging.getLogger(__name__)
+
+def load_sentence_transformer(model_name: str):
+    """Import sentence_transformers (and torch) only when a model is actually loaded"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+class DatingService:
+    """Main service for dating app functionality"""
+    
+    def __init__(self):
+        self.embedding_model = None
+        self.model_name = settings.embedding_model_name
+        self.index_version: Optional[str] = None
+        self.users: List[Dict[str, Any]] = []
+        self.user_rows: Dict[str, int] = {}
+        self.user_embeddings: Optional[EmbeddingStore] = None
+        # Fields summed under the default weights: the common case scans dim, not fields x dim
+        self.combined_embeddings: Optional[EmbeddingStore] = None
+        self.user_preferences: Optional[PreferenceStore] = None
+        self.profile_fields: List[str] = list(PROFILE_FIELDS)
+        self.geo_index = GeoIndex(Gazetteer(settings.gazetteer_path))
+        
+        # Pre-serialized JSON per profile id: (profile, open search result)
+        self.profile_fragments: Dict[str, Tuple[bytes, bytes]] = {}
+        self.users_json: Optional[bytes] = None
+        
+        # Scatter-gather shards; in sharded mode there is no local embedding store
+        self.shards: Optional[ShardCoordinator] = None
+        self.shard_generation: Optional[int] = None
+        self._generations = itertools.count(1)
+        self._restoring: set = set()
+        self._background: set = set()
+        
+        # Upserts, shard restores and index activation change the index one at a time
+        self._index_lock = asyncio.Lock()
+        
+        # Interactions are logged behind the request path and folded into preferences in batches
+        self.interaction_log = InteractionLog(
+            settings.interaction_log_dir,
+            settings.interaction_segment_bytes,
+            settings.interaction_flush_interval_s,
+            settings.interaction_max_pending
+        )
+        self._unapplied: List[Dict[str, Any]] = []
+        self._preference_lock = asyncio.Lock()
+        # Logged events reflected in user_preferences; None after a failed apply, so no snapshot skips them
+        self._preferences_applied: Optional[int] = None
+        self._preferences_saved = 0
+        self._preferences_saved_at = 0.0
+        
+        # Initialize agents
+        self.query_enhancer = QueryEnhancerAgent()
+        self.filter_extractor = FilterExtractorAgent()
+        
+        # Initialize tasks
+        self.embedding_task = None
+        self.field_embedding_task = None
+        self.filter_task = FilterTask()
+        self.scoring_task = MatchScoringTask()
+    
+    async def initialize(self):
+        """Initialize the dating service"""
+        logger.info("Initializing Dating Service...")
+        
+        if settings.search_shards > 0:
+            self.shards = ShardCoordinator.local(
+                settings.search_shards,
+                self._store_kwargs(),
+                settings.gazetteer_path,
+                settings.shard_timeout_s
+            )
+            self.shards.start()
+        
+        # Load user data
+        await self._load_users()
+        self.geo_index.build([user.get('location', '') for user in self.users])
+        self._reset_fragments()
+        
+        # Serve the activated re-embedded index if there is one
+        version = current_version(settings.embedding_index_dir)
+        if not (version and await self.activate_index(version)):
+            # Load embedding model
+            await self._load_embedding_model()
+            
+            # Generate embeddings
+            await self._generate_embeddings()
+        
+        await self._start_interactions()
+        
+        logger.info("Dating Service initialized successfully")
+    
+    async def _load_embedding_model(self):
+        """Load the sentence transformer model"""
+        loop = asyncio.get_event_loop()
+        self.embedding_model = await loop.run_in_executor(
+            None, 
+            load_sentence_transformer, 
+            settings.embedding_model_name
+        )
+        self.embedding_task = EmbeddingTask(self.embedding_model)
+        self.field_embedding_task = FieldEmbeddingTask(
+            self.embedding_task,
+            settings.embedding_model_name,
+            settings.embedding_cache_dir
+        )
+        logger.info(f"Loaded embedding model: {settings.embedding_model_name}")
+    
+    async def _load_users(self):
+        """Load users from JSON file"""
+        users_path = Path(settings.users_json_path)
+        
+        if not users_path.exists():
+            logger.warning(f"Users file not found: {users_path}")
+            self.users = []
+            return
+        
+        try:
+            with open(users_path, 'r', encoding='utf-8') as file:
+                self.users = json.load(file)
+            logger.info(f"Loaded {len(self.users)} users")
+        except Exception as e:
+            logger.error(f"Error loading users: {e}")
+            self.users = []
+        
+        self.user_rows = {user.get('id'): row for row, user in enumerate(self.users)}
+    
+    async def activate_index(self, version: str) -> bool:
+        """Load a ready index version and its model, then switch to it atomically"""
+        with workload_context("batch"):
+            async with self._index_lock:
+                if not await self._switch_index(version):
+                    return False
+        
+        # Preferences live in the embedding space, so relearn them against the new vectors
+        if self.interaction_log.is_open:
+            await self._rebuild_preferences()
+        return True
+    
+    async def _switch_index(self, version: str) -> bool:
+        """Build the index of a ready version off to the side and swap it in"""
+        manifest = read_manifest(settings.embedding_index_dir, version)
+        if manifest is None or manifest.get('status') != 'ready':
+            logger.warning(f"Index {version} is not ready, keeping {self.index_version or self.model_name}")
+            return False
+        
+        model_name = manifest['model_name']
+        fields = [field for field in manifest.get('fields', []) if field in PROFILE_FIELDS]
+        
+        # Everything is prepared off to the side while searches keep using the old index
+        model = await run_in_workload(load_sentence_transformer, model_name)
+        embedding_task = EmbeddingTask(model)
+        field_embedding_task = FieldEmbeddingTask(
+            embedding_task,
+            model_name,
+            str(Path(settings.embedding_index_dir) / version)
+        )
+        store, combined, generation = await self._build_index(field_embedding_task, fields)
+        previous_generation = self.shard_generation
+        
+        # No awaits below: in-flight searches see either the old or the new index, never a mix
+        self.embedding_model = model
+        self.embedding_task = embedding_task
+        self.field_embedding_task = field_embedding_task
+        self.profile_fields = fields
+        self.user_embeddings = store
+        self.combined_embeddings = combined
+        self.shard_generation = generation
+        self.user_preferences = None
+        self.model_name = model_name
+        self.index_version = version
+        
+        self._retire_generation(previous_generation)
+        logger.info(f"Switched to index {version} ({model_name})")
+        return True
+    
+    async def index_status(self) -> Dict[str, Any]:
+        """Active index and all versions on disk"""
+        return {
+            'active_version': self.index_version,
+            'model_name': self.model_name,
+            'current_version': current_version(settings.embedding_index_dir),
+            'versions': list_versions(settings.embedding_index_dir)
+        }
+    
+    @staticmethod
+    def _default_weights(fields: List[str]) -> Dict[str, float]:
+        """Configured field weights restricted to the fields of the live index"""
+        return {field: w for field, w in settings.profile_field_weights.items() if field in fields}
+    
+    def _pack(self, field_vectors: Dict[str, np.ndarray], fields: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Field groups as parallel blocks of one matrix, and their sum under the default weights"""
+        default_weights = MatchScoringTask.field_weights(fields, self._default_weights(fields))
+        return (
+            FieldEmbeddingTask.combine(field_vectors, fields),
+            FieldEmbeddingTask.combine_weighted(field_vectors, fields, default_weights)
+        )
+    
+    async def _build_store(
+        self,
+        field_embedding_task: FieldEmbeddingTask,
+        fields: List[str]
+    ) -> Tuple[Optional[EmbeddingStore], Optional[EmbeddingStore]]:
+        """Encode (or load cached) field vectors and pack them into new per-field and combined stores"""
+        if not self.users:
+            return None, None
+        
+        field_vectors = await field_embedding_task.encode_fields(self.users, fields, prune=True)
+        vectors, combined = self._pack(field_vectors, fields)
+        store, combined_store = self._create_embedding_store(), self._create_embedding_store()
+        await run_in_workload(store.build, vectors, False)
+        await run_in_workload(combined_store.build, combined, False)
+        return store, combined_store
+    
+    async def _build_index(
+        self,
+        field_embedding_task: FieldEmbeddingTask,
+        fields: List[str]
+    ) -> Tuple[Optional[EmbeddingStore], Optional[EmbeddingStore], Optional[int]]:
+        """Build local stores, or load a new corpus generation onto the shards"""
+        if self.shards is None:
+            return (*await self._build_store(field_embedding_task, fields), None)
+        if not self.users:
+            return None, None, None
+        
+        field_vectors = await field_embedding_task.encode_fields(self.users, fields, prune=True)
+        generation = next(self._generations)
+        await self.shards.load(generation, list(self.users), *self._pack(field_vectors, fields))
+        return None, None, generation
+    
+    def _retire_generation(self, generation: Optional[int]):
+        """Drop a replaced shard generation once searches that snapshotted it have finished"""
+        if self.shards is None or generation is None or generation == self.shard_generation:
+            return
+        
+        async def drop():
+            await asyncio.sleep(settings.search_timeout_s + settings.shard_timeout_s)
+            await self.shards.drop(generation)
+        
+        self._spawn(drop())
+    
+    async def _restore_shard(self, shard_id: int):
+        """Restart a dead or stale shard and reload its slice from the field embedding cache"""
+        try:
+            with workload_context("batch"):
+                # Holding the index lock keeps upserts and switches from racing the reload
+                async with self._index_lock:
+                    rows = self.shards.partition(len(self.users))[shard_id]
+                    users = [self.users[i] for i in rows]
+                    field_vectors = await self.field_embedding_task.encode_fields(users, self.profile_fields)
+                    await self.shards.restore(shard_id, self.shard_generation, users, *self._pack(field_vectors, self.profile_fields))
+        except Exception as e:
+            logger.error(f"Restoring shard {shard_id} failed: {e}")
+        finally:
+            self._restoring.discard(shard_id)
+    
+    def _heal_shards(self, failed: List[int]):
+        """Restore shards that died or missed a load, in the background"""
+        for shard_id in failed:
+            if shard_id in self._restoring:
+                continue
+            if not self.shards.shards[shard_id].alive or shard_id in self.shards.stale:
+                self._restoring.add(shard_id)
+                self._spawn(self._restore_shard(shard_id))
+    
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+    
+    def shutdown(self):
+        """Stop background work and shard processes, and flush the interaction log"""
+        for task in list(self._background):
+            task.cancel()
+        if self.shards is not None:
+            self.shards.stop()
+        if self.interaction_log.is_open:
+            self.interaction_log.close()
+    
+    async def _start_interactions(self):
+        """Open the interaction log, learn preferences from it and start applying new events"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.interaction_log.open)
+        await self._rebuild_preferences()
+        self._spawn(self._apply_interactions_loop())
+    
+    def _index_key(self) -> str:
+        """Embedding space the preference vectors live in"""
+        weights = ','.join(f"{field}={weight}" for field, weight in sorted(self._default_weights(self.profile_fields).items()))
+        return f"{self.model_name}|{self.index_version or ''}|{weights}"
+    
+    def _preference_snapshot_path(self) -> Path:
+        return Path(settings.interaction_log_dir) / "preferences.npz"
+    
+    async def _rebuild_preferences(self, batch_size: int = 50000):
+        """Learn preferences for the live index from the last snapshot and the events logged after it"""
+        with workload_context("batch"):
+            async with self._preference_lock:
+                # Everything not yet applied is covered by the replay
+                self._unapplied = []
+                replay_until = self.interaction_log.appended
+                await run_in_workload(self.interaction_log.flush)
+                
+                preferences, start = None, 0
+                try:
+                    snapshot = await run_in_workload(
+                        PreferenceStore.load, self._preference_snapshot_path(), self.user_rows,
+                        len(self.users), settings.preference_decay, self._index_key()
+                    )
+                    if snapshot is not None and snapshot[1] <= replay_until:
+                        preferences, start = snapshot
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable preference snapshot: {e}")
+                if preferences is None:
+                    # Preferences decay with every interaction, so the newest events carry nearly all the weight
+                    preferences = PreferenceStore(len(self.users), settings.preference_decay)
+                    if settings.preference_replay_limit > 0:
+                        start = max(0, replay_until - settings.preference_replay_limit)
+                self._preferences_saved = start
+                
+                events = self.interaction_log.replay(start, replay_until)
+                skipped = 0
+                while True:
+                    batch = await run_in_workload(lambda: list(itertools.islice(events, batch_size)))
+                    if not batch:
+                        break
+                    try:
+                        skipped += await self._apply_events(preferences, batch)
+                    except Exception as e:
+                        # A bad batch costs its own events, not everything learned so far
+                        logger.error(f"Replaying {len(batch)} interactions failed, skipping them: {e}")
+                        skipped += len(batch)
+                
+                self.user_preferences = preferences
+                self._preferences_applied = replay_until if skipped == 0 else None
+                logger.info(
+                    f"Learned preferences from interactions {start}-{replay_until} "
+                    f"({skipped} left out): {preferences.stats()}"
+                )
+    
+    async def _apply_interactions_loop(self):
+        """Fold newly recorded interactions into the preference vectors, off the request path"""
+        with workload_context("batch"):
+            while True:
+                await asyncio.sleep(settings.interaction_apply_interval_s)
+                async with self._preference_lock:
+                    events, self._unapplied = self._unapplied, []
+                    if self.user_preferences is None:
+                        # A rebuild is pending and will replay these from the log
+                        continue
+                    if events:
+                        try:
+                            if await self._apply_events(self.user_preferences, events):
+                                self._preferences_applied = None
+                            elif self._preferences_applied is not None:
+                                self._preferences_applied += len(events)
+                        except Exception as e:
+                            logger.error(f"Applying {len(events)} interactions failed, they will be replayed on restart: {e}")
+                            self._preferences_applied = None
+                    await self._save_preferences()
+    
+    async def _save_preferences(self):
+        """Snapshot the preferences every so often, so a restart replays only newer events"""
+        applied = self._preferences_applied
+        interval = settings.preference_snapshot_interval_s
+        if interval <= 0 or applied is None or applied == self._preferences_saved:
+            return
+        if time.monotonic() - self._preferences_saved_at < interval:
+            return
+        try:
+            await run_in_workload(
+                self.user_preferences.save, self._preference_snapshot_path(), self.users, applied, self._index_key()
+            )
+            self._preferences_saved = applied
+            self._preferences_saved_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Saving the preference snapshot failed: {e}")
+    
+    @staticmethod
+    def _event_batch(
+        events: List[Dict[str, Any]],
+        user_rows: Dict[str, int]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(actor rows, weights, engaged rows, engaged index per event), listing each engaged profile once"""
+        actors, targets, weights = event_rows(events, user_rows, settings.interaction_weights)
+        unique_targets, target_index = np.unique(targets, return_inverse=True)
+        return actors, weights, unique_targets, target_index
+    
+    async def _apply_events(self, preferences: PreferenceStore, events: List[Dict[str, Any]]) -> int:
+        """Update preferences with the current embeddings of the engaged profiles; returns the events left out"""
+        actors, weights, unique_targets, target_index = await run_in_workload(self._event_batch, events, self.user_rows)
+        if len(actors) == 0:
+            return 0
+        
+        left_out = 0
+        if self.shard_generation is not None:
+            vectors, resolved = await self.shards.vectors(self.shard_generation, unique_targets)
+            keep = resolved[target_index]
+            left_out = len(keep) - int(keep.sum())
+            if left_out:
+                # Profiles on shards that did not answer are left out, the rest still count
+                actors, weights, target_index = actors[keep], weights[keep], target_index[keep]
+                self._heal_shards(sorted(set((unique_targets[~resolved] % len(self.shards)).tolist())))
+        elif self.combined_embeddings is not None:
+            vectors = await run_in_workload(self.combined_embeddings.decode, unique_targets)
+        else:
+            return len(actors)
+        
+        preferences.resize(len(self.users))
+        await run_in_workload(preferences.apply, actors, vectors, weights, target_index)
+        return left_out
+    
+    async def record_interactions(self, events: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """Queue interactions between known users; returns (accepted, rejected)"""
+        accepted = [
+            new_event(event['user_id'], event['target_id'], event['action'], event.get('timestamp'))
+            for event in events
+            if event['user_id'] in self.user_rows
+            and event['target_id'] in self.user_rows
+            and event['user_id'] != event['target_id']
+            and event['action'] in settings.interaction_weights
+        ]
+        if accepted:
+            self.interaction_log.append(accepted)
+            self._unapplied.extend(accepted)
+        return len(accepted), len(events) - len(accepted)
+    
+    def interaction_stats(self) -> Dict[str, Any]:
+        """Log and preference counters"""
+        stats = self.interaction_log.stats()
+        stats['unapplied'] = len(self._unapplied)
+        if self.user_preferences is not None:
+            stats.update(self.user_preferences.stats())
+        return stats
+    
+    async def _generate_embeddings(self):
+        """Generate per-field embeddings for all users"""
+        if not self.users:
+            return
+        
+        store, combined, generation = await self._build_index(self.field_embedding_task, self.profile_fields)
+        previous_generation = self.shard_generation
+        self.user_embeddings = store
+        self.combined_embeddings = combined
+        self.shard_generation = generation
+        self._retire_generation(previous_generation)
+        logger.info(f"Generated embeddings for all users across fields: {', '.join(self.profile_fields)}")
+    
+    def _store_kwargs(self) -> Dict[str, Any]:
+        """Embedding store configuration, shared with the shard processes"""
+        return {
+            'precision': settings.embedding_precision,
+            'pq_subvectors': settings.embedding_pq_subvectors,
+            'pq_centroids': settings.embedding_pq_centroids,
+            'rerank_top': settings.embedding_rerank_top,
+            'cache_dir': settings.embedding_cache_dir,
+        }
+    
+    def _create_embedding_store(self) -> EmbeddingStore:
+        """Create an embedding store with the configured precision"""
+        return EmbeddingStore(**self._store_kwargs())
+    
+    async def rank_profiles(
+        self,
+        query: str,
+        user_id: Optional[str] = None,
+        top_k: int = None,
+        field_weights: Optional[Dict[str, float]] = None,
+        diversity_lambda: Optional[float] = None,
+        geo_filters: Optional[Dict[str, Any]] = None,
+        use_preferences: bool = False
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """Top (profile, score) pairs for a natural language query"""
+        if not self.users or (self.user_embeddings is None and self.shard_generation is None):
+            return []
+        
+        # Snapshot the index so a blue/green switch cannot mix models mid-query; rows a concurrent
+        # upsert appends lie past count and stay out of this search
+        users, count, geo_index = self.users, len(self.users), self.geo_index
+        embedding_task, store, fields = self.embedding_task, self.user_embeddings, self.profile_fields
+        combined, generation, preferences = self.combined_embeddings, self.shard_generation, self.user_preferences
+        
+        top_k = top_k or settings.default_top_k
+        default_weights = self._default_weights(fields)
+        weights = dict(default_weights)
+        weights.update(field_weights or {})
+        if weights == default_weights:
+            # Precombined vectors score the default weights at single-field cost
+            store, weights = combined, None
+        if diversity_lambda is None:
+            diversity_lambda = settings.default_diversity_lambda
+        
+        # Enhance query
+        enhanced_query = await self.query_enhancer.process(query)
+        
+        # Extract filters
+        filters = await self.filter_extractor.process(query)
+        
+        filters.update(geo_filters or {})
+        
+        # Generate query embedding
+        query_embeddings = await embedding_task.generate_embeddings([enhanced_query])
+        
+        # Blend in what the user's likes, passes and openers say about their taste
+        preference = None
+        if use_preferences and user_id and preferences is not None and settings.preference_weight > 0:
+            row = self.user_rows.get(user_id)
+            if row is not None:
+                preference = preferences.get(row, settings.preference_min_interactions)
+        
+        wanted = top_k + (1 if user_id else 0)  # Get extra if excluding self
+        if generation is not None:
+            scored_users = await self._rank_sharded(
+                query_embeddings[0], users, count, geo_index, generation, fields, weights, filters, wanted, diversity_lambda, preference
+            )
+        else:
+            scored_users = await self._rank_local(
+                query_embeddings[0], users, count, geo_index, store, fields, weights, filters, wanted, diversity_lambda, preference
+            )
+        
+        # Skip searching user
+        ranked = [(user, score) for user, score in scored_users if not (user_id and user.get('id') == user_id)]
+        return ranked[:top_k]
+    
+    async def _rank_local(
+        self,
+        query_embedding: np.ndarray,
+        users: List[Dict[str, Any]],
+        count: int,
+        geo_index: GeoIndex,
+        store: EmbeddingStore,
+        fields: List[str],
+        weights: Optional[Dict[str, float]],
+        filters: Dict[str, Any],
+        top_k: int,
+        diversity_lambda: Optional[float],
+        preference: Optional[np.ndarray] = None
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """Filter and score the whole corpus in this process"""
+        # Apply filters as a row mask over the profile store
+        mask = await self.filter_task.build_mask(
+            users,
+            filters,
+            geo_index,
+            settings.default_location_radius_km,
+            count
+        )
+        
+        if not mask.any():
+            mask[:] = True
+        
+        filtered_indices = np.flatnonzero(mask)
+        filtered_users = [users[i] for i in filtered_indices]
+        
+        # Calculate weighted field similarities on the compact store
+        similarities = await self.scoring_task.score_fields(
+            query_embedding, 
+            store,
+            fields,
+            weights,
+            filtered_indices,
+            preference,
+            settings.preference_weight
+        )
+        
+        # Rank matches
+        if diversity_lambda is not None and diversity_lambda < 1:
+            return await self.scoring_task.diversify_matches(
+                filtered_users,
+                similarities,
+                store,
+                filtered_indices,
+                top_k,
+                diversity_lambda,
+                settings.mmr_candidates
+            )
+        return await self.scoring_task.rank_matches(filtered_users, similarities, top_k)
+    
+    async def _rank_sharded(
+        self,
+        query_embedding: np.ndarray,
+        users: List[Dict[str, Any]],
+        count: int,
+        geo_index: GeoIndex,
+        generation: int,
+        fields: List[str],
+        weights: Optional[Dict[str, float]],
+        filters: Dict[str, Any],
+        top_k: int,
+        diversity_lambda: Optional[float],
+        preference: Optional[np.ndarray] = None
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """Scatter the weighted query to the shards and merge their top-k"""
+        query = MatchScoringTask.blended_query(query_embedding, fields, weights, preference, settings.preference_weight)
+        diversify = diversity_lambda is not None and diversity_lambda < 1
+        k = max(settings.mmr_candidates, top_k) if diversify else top_k
+        filters = self._shard_filters(filters, geo_index)
+        
+        combined = weights is None
+        
+        results = await self.shards.search(generation, query, filters, k, diversify, settings.default_location_radius_km, combined)
+        if results.matched == 0 and filters:
+            # Same fallback as the local path: no match at all means no filtering
+            results = await self.shards.search(generation, query, {}, k, diversify, settings.default_location_radius_km, combined)
+        
+        if results.failed:
+            logger.warning(f"Partial search results: shards {results.failed} did not answer")
+            self._heal_shards(results.failed)
+        
+        # Rows appended after this search started are not part of it
+        current = np.flatnonzero(results.rows < count)
+        rows, scores = results.rows[current], results.scores[current]
+        order = np.arange(min(top_k, len(rows)))
+        if diversify and len(rows):
+            order = await run_in_workload(
+                MatchScoringTask.mmr_order, scores, results.vectors[current], top_k, diversity_lambda
+            )
+        return [(users[rows[i]], scores[i]) for i in order]
+    
+    def _shard_filters(self, filters: Dict[str, Any], geo_index: GeoIndex) -> Dict[str, Any]:
+        """Rewrite filters that need the whole corpus into ones each shard can apply alone"""
+        if not filters.get('nearest') or 'location' not in filters:
+            return filters
+        
+        # Nearest-N is global: send the distance of the N-th closest profile as a radius instead
+        coords = geo_index.gazetteer.lookup(filters['location'].lower())
+        radius_km = geo_index.nearest_distance(*coords, int(filters['nearest'])) if coords else None
+        if radius_km is None:
+            return filters
+        
+        shard_filters = {key: value for key, value in filters.items() if key != 'nearest'}
+        shard_filters['radius_km'] = radius_km + 1e-3
+        return shard_filters
+    
+    async def search_profiles(
+        self,
+        query: str,
+        user_id: Optional[str] = None,
+        top_k: int = None,
+        field_weights: Optional[Dict[str, float]] = None,
+        diversity_lambda: Optional[float] = None,
+        geo_filters: Optional[Dict[str, Any]] = None,
+        use_preferences: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Search for profiles based on natural language query"""
+        ranked = await self.rank_profiles(query, user_id, top_k, field_weights, diversity_lambda, geo_filters, use_preferences)
+        
+        # Format results
+        results = []
+        for user, score in ranked:
+            result = result_fields(user)
+            result['similarity_score'] = float(score)
+            result['match_percentage'] = int(score * 100)
+            results.append(result)
+        
+        return results
+    
+    async def search_profiles_json(
+        self,
+        query: str,
+        user_id: Optional[str] = None,
+        top_k: int = None,
+        field_weights: Optional[Dict[str, float]] = None,
+        diversity_lambda: Optional[float] = None,
+        geo_filters: Optional[Dict[str, Any]] = None,
+        use_preferences: bool = False
+    ) -> List[bytes]:
+        """Search results as pre-serialized JSON objects"""
+        ranked = await self.rank_profiles(query, user_id, top_k, field_weights, diversity_lambda, geo_filters, use_preferences)
+        return [
+            result_fragment(self._fragments(user)[1], score)
+            for user, score in ranked
+        ]
+    
+    def _fragments(self, user: Dict[str, Any]) -> Tuple[bytes, bytes]:
+        """Cached (profile, result prefix) fragments of a user"""
+        user_id = user.get('id')
+        fragments = self.profile_fragments.get(user_id)
+        if fragments is None:
+            fragments = (profile_fragment(user), result_prefix(user))
+            self.profile_fragments[user_id] = fragments
+        return fragments
+    
+    def _reset_fragments(self, user_id: Optional[str] = None):
+        """Drop cached JSON fragments for one user or all of them"""
+        if user_id is None:
+            self.profile_fragments = {}
+        else:
+            self.profile_fragments.pop(user_id, None)
+        self.users_json = None
+    
+    async def get_user_json(self, user_id: str) -> Optional[bytes]:
+        """Pre-serialized profile by ID"""
+        user = await self.get_user_by_id(user_id)
+        return self._fragments(user)[0] if user else None
+    
+    async def get_all_users_json(self) -> bytes:
+        """Pre-serialized array of all profiles"""
+        if self.users_json is None:
+            self.users_json = json_array(self._fragments(user)[0] for user in self.users)
+        return self.users_json
+    
+    async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get user profile by ID"""
+        row = self.user_rows.get(user_id)
+        return self.users[row] if row is not None else None
+    
+    async def upsert_user(self, profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Add or replace a profile, encoding only its fields and writing its rows in place"""
+        user_id = profile.get('id')
+        async with self._index_lock:
+            row = self.user_rows.get(user_id, len(self.users))
+            if self.field_embedding_task is not None:
+                await self._update_index(row, profile)
+            
+            # No awaits below; searches count their rows when they start, so an appended row
+            # only shows up in searches that start once it is complete
+            if row == len(self.users):
+                self.users.append(profile)
+            else:
+                self.users[row] = profile
+            self.geo_index.update(row, profile.get('location', ''))
+            self.user_rows[user_id] = row
+            self._reset_fragments(user_id)
+        
+        logger.info(f"Upserted user {user_id} at row {row}")
+        return profile
+    
+    async def _update_index(self, row: int, profile: Dict[str, Any]):
+        """Write the vectors of one profile into the live stores, or onto the shard owning it"""
+        field_vectors = await self.field_embedding_task.encode_fields([profile], self.profile_fields)
+        vectors, combined = self._pack(field_vectors, self.profile_fields)
+        
+        if self.shards is None:
+            store = self.user_embeddings or self._create_embedding_store()
+            combined_store = self.combined_embeddings or self._create_embedding_store()
+            await run_in_workload(store.set_rows, [row], vectors, False)
+            await run_in_workload(combined_store.set_rows, [row], combined, False)
+            self.user_embeddings, self.combined_embeddings = store, combined_store
+        elif self.shard_generation is None:
+            # First profile of an empty corpus
+            generation = next(self._generations)
+            await self.shards.load(generation, [profile], vectors, combined)
+            self.shard_generation = generation
+        else:
+            await self.shards.update(self.shard_generation, np.array([row]), [profile], vectors, combined)
+            if self.shards.stale:
+                self._heal_shards(sorted(self.shards.stale))
+    
+    async def get_all_users(self) -> List[Dict[str, Any]]:
+        """Get all users"""
+        return self.users
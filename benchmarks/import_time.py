@@ -0,0 +1,74 @@
+#import_time.py
+"""Import-time budget for the API process.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter, prints
+the slowest top-level packages and fails (exit code 1) when the total
+exceeds the budget or when a heavy ML library is imported eagerly.
+
+    python -m benchmarks.import_time --budget-ms 1500
+"""
+
+from typing import Dict, List, Tuple
+from pathlib import Path
+import argparse
+import subprocess
+import sys
+
+ROOT = Path(__file__).parent.parent
+
+# Only components that run inference may import these, and only lazily
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "sklearn")
+
+def measure(module: str) -> Tuple[int, Dict[str, int]]:
+    """Total import time of module and cumulative time per top-level package, in microseconds"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    total = 0
+    packages: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        name = name.strip()
+        top_level = name.split(".")[0]
+        packages[top_level] = packages.get(top_level, 0) + int(self_us)
+        if name == module:
+            total = int(cumulative_us)
+    return total, packages
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when importing the API exceeds its time budget")
+    parser.add_argument("--module", default="main", help="Module to import")
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="Maximum cumulative import time")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to measure (best run counts)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to print")
+    args = parser.parse_args()
+
+    runs: List[Tuple[int, Dict[str, int]]] = [measure(args.module) for _ in range(args.runs)]
+    total, packages = min(runs, key=lambda run: run[0])
+    total_ms = total / 1000
+
+    print(f"import {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms, best of {args.runs})")
+    for name, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<28} {self_us / 1000:8.1f} ms")
+
+    failures = []
+    eager = [name for name in HEAVY_MODULES if name in packages]
+    if eager:
+        failures.append(f"heavy ML libraries imported eagerly: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
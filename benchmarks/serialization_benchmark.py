@@ -0,0 +1,93 @@
+#serialization_benchmark.py
+"""Serialization cost per 1k search results: validated models vs pre-serialized fragments.
+
+Run from the repository root:
+    python -m benchmarks.serialization_benchmark
+"""
+
+import json
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+
+from app.api.models.dating_schema import SearchResponse, UserProfile
+from app.core.serialization import (
+    orjson, result_fields, profile_fragment, result_prefix, result_fragment, json_array, json_object, dumps
+)
+
+USERS_PATH = Path(__file__).parent.parent / "app" / "Database" / "users.json"
+RESULTS = 1000
+REPEATS = 20
+
+def load_results():
+    with open(USERS_PATH, 'r', encoding='utf-8') as file:
+        base = json.load(file)
+    users = []
+    for i in range(RESULTS):
+        user = dict(base[i % len(base)])
+        user['id'] = f"user_{i:06d}"
+        users.append(user)
+    return users, [random.random() for _ in users]
+
+def validated_path(users, scores):
+    """What /search did before: dicts -> SearchResponse -> response_model validation -> JSON"""
+    results = []
+    for user, score in zip(users, scores):
+        result = result_fields(user)
+        result['similarity_score'] = float(score)
+        result['match_percentage'] = int(score * 100)
+        results.append(result)
+    response = SearchResponse(
+        success=True,
+        query="benchmark",
+        total_results=len(results),
+        results=results,
+        timestamp=datetime.now().isoformat()
+    )
+    response = SearchResponse.model_validate(response.model_dump())
+    return json.dumps(jsonable_encoder(response)).encode('utf-8')
+
+def fast_path(prefixes, scores):
+    """Fast mode: cached per-profile prefixes closed with the per-query scores"""
+    fragments = [result_fragment(prefix, score) for prefix, score in zip(prefixes, scores)]
+    return json_object({
+        'success': b'true',
+        'query': dumps("benchmark"),
+        'total_results': str(len(fragments)).encode('ascii'),
+        'results': json_array(fragments),
+        'timestamp': dumps(datetime.now().isoformat())
+    })
+
+def users_validated(users):
+    return json.dumps(jsonable_encoder([UserProfile(**user) for user in users])).encode('utf-8')
+
+def timed(fn, *args):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    users, scores = load_results()
+
+    start = time.perf_counter()
+    prefixes = [result_prefix(user) for user in users]
+    profiles = [profile_fragment(user) for user in users]
+    build_ms = (time.perf_counter() - start) * 1000
+
+    assert json.loads(validated_path(users, scores))["results"] == json.loads(fast_path(prefixes, scores))["results"]
+
+    print(f"encoder: {'orjson' if orjson is not None else 'json (orjson not installed)'}")
+    print(f"one-time fragment build:        {build_ms:8.2f} ms / {RESULTS} profiles")
+    print(f"/search validated (before):     {timed(validated_path, users, scores):8.2f} ms / {RESULTS} results")
+    print(f"/search fragments (fast mode):  {timed(fast_path, prefixes, scores):8.2f} ms / {RESULTS} results")
+    print(f"/users validated (before):      {timed(users_validated, users):8.2f} ms / {RESULTS} profiles")
+    print(f"/users fragments (fast mode):   {timed(json_array, profiles):8.2f} ms / {RESULTS} profiles")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import json
 from datetime import datetime
 import pandas as pd
@@ -8,6 +13,10 @@ import time
 
 # Configuration
 API_BASE_URL = "http://localhost:8000"
+API_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+HTTP_POOL_SIZE = 16
+HEALTH_TTL = 10
+USERS_TTL = 60
 
 # Page config
 st.set_page_config(
@@ -59,11 +68,71 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# HTTP client layer: one pooled keep-alive session and worker pool per Streamlit process
+@st.cache_resource
+def get_http_session():
+    """Shared requests session with connection pooling and GET retries"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=Retry(total=2, backoff_factor=0.2, allowed_methods=["GET"])
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def get_request_pool():
+    """Thread pool for issuing independent API calls concurrently"""
+    return ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE)
+
+def submit_request(fn, *args):
+    """Run an API call on the pool with the current script context attached"""
+    ctx = get_script_run_ctx()
+    
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+    
+    return get_request_pool().submit(run)
+
+def api_get(path, timeout=API_TIMEOUT):
+    return get_http_session().get(f"{API_BASE_URL}{path}", timeout=timeout)
+
+def api_post(path, payload, timeout=API_TIMEOUT):
+    return get_http_session().post(f"{API_BASE_URL}{path}", json=payload, timeout=timeout)
+
+@st.cache_data(ttl=HEALTH_TTL, show_spinner=False)
+def _fetch_health():
+    # Failures raise so an outage is never cached
+    response = api_get("/health", timeout=5)
+    response.raise_for_status()
+    return True
+
+@st.cache_data(ttl=USERS_TTL, show_spinner=False)
+def _fetch_users():
+    response = api_get("/api/v1/dating/users")
+    response.raise_for_status()
+    return response.json()
+
+@st.cache_data(ttl=USERS_TTL, show_spinner=False)
+def get_app_stats():
+    """Aggregate statistics over all users"""
+    users = _fetch_users()
+    if not users:
+        return None
+    return {
+        'total_users': len(users),
+        'avg_age': sum(user['age'] for user in users) / len(users),
+        'unique_locations': len({user['location'] for user in users}),
+        'unique_professions': len({user['profession'] for user in users}),
+    }
+
 def check_api_health():
     """Check if the FastAPI backend is running"""
     try:
-        response = requests.get(f"{API_BASE_URL}/health", timeout=5)
-        return response.status_code == 200
+        return _fetch_health()
     except:
         return False
 
@@ -75,7 +144,7 @@ def search_profiles(query, user_id=None, top_k=5):
             "user_id": user_id,
             "top_k": top_k
         }
-        response = requests.post(f"{API_BASE_URL}/api/v1/dating/search", json=payload)
+        response = api_post("/api/v1/dating/search", payload)
         if response.status_code == 200:
             return response.json()
         else:
@@ -88,11 +157,7 @@ def search_profiles(query, user_id=None, top_k=5):
 def get_all_users():
     """Get all users from the API"""
     try:
-        response = requests.get(f"{API_BASE_URL}/api/v1/dating/users")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return []
+        return _fetch_users()
     except:
         return []
 
@@ -100,7 +165,7 @@ def generate_conversation_starter(target_user_id):
     """Generate conversation starter"""
     try:
         payload = {"target_user_id": target_user_id}
-        response = requests.post(f"{API_BASE_URL}/api/v1/chat/opener", json=payload)
+        response = api_post("/api/v1/chat/opener", payload)
         if response.status_code == 200:
             return response.json()
         else:
@@ -108,7 +173,26 @@ def generate_conversation_starter(target_user_id):
     except:
         return None
 
-def display_user_card(user, show_score=True):
+def generate_conversation_starters(target_user_ids, personalized=False):
+    """Generate conversation starters for a page of results in one call"""
+    starters = {}
+    try:
+        payload = {"target_user_ids": target_user_ids, "personalized": personalized}
+        response = api_post("/api/v1/chat/openers", payload)
+        if response.status_code == 200:
+            starters = {s['target_user_id']: s for s in response.json()['starters']}
+    except:
+        pass
+    
+    # Fall back to per-card requests, issued concurrently
+    remaining = [user_id for user_id in target_user_ids if user_id not in starters]
+    if remaining and not starters:
+        futures = {user_id: submit_request(generate_conversation_starter, user_id) for user_id in remaining}
+        starters.update({user_id: f.result() for user_id, f in futures.items() if f.result()})
+    
+    return starters
+
+def display_user_card(user, show_score=True, starter=None):
     """Display a user card"""
     with st.container():
         col1, col2, col3 = st.columns([1, 2, 1])
@@ -141,7 +225,7 @@ def display_user_card(user, show_score=True):
 
         with col_btn1:
             if st.button(f"💬 Chat with {user.get('name', 'User')}", key=f"chat_{user.get('id')}"):
-                starter = generate_conversation_starter(user.get('id'))
+                starter = starter or generate_conversation_starter(user.get('id'))
                 if starter:
                     st.success(f"💡 Conversation starter: {starter['starter']}")
                 else:
@@ -165,8 +249,12 @@ def main():
         """, unsafe_allow_html=True)
 
     
+    # Health check and user list are independent, fetch them together
+    health_future = submit_request(check_api_health)
+    users_future = submit_request(get_all_users)
+    
     # Check API health
-    if not check_api_health():
+    if not health_future.result():
         st.error("🚨 Backend API is not running! Please start the FastAPI server first.")
         st.info("Run: `uvicorn main:app --reload` in your terminal")
         st.stop()
@@ -178,7 +266,7 @@ def main():
         st.markdown("## 🔍 Search Settings")
         
         # Current user selection
-        users = get_all_users()
+        users = users_future.result()
         if users:
             user_options = {f"{user['name']} ({user['age']})": user['id'] for user in users}
             selected_user = st.selectbox(
@@ -246,9 +334,12 @@ def main():
                     # Display results
                     st.markdown("## 💫 Your Matches")
                     
+                    # One request for the openers of every card on the page
+                    starters = generate_conversation_starters([user['id'] for user in results['results']])
+                    
                     for i, user in enumerate(results['results'], 1):
                         st.markdown(f"### Match #{i}")
-                        display_user_card(user, show_score=True)
+                        display_user_card(user, show_score=True, starter=starters.get(user['id']))
                         st.markdown("---")
                     
                     # Store results in session state for analytics
@@ -326,24 +417,22 @@ def main():
     
     with col3:
         if st.button("📈 App Stats"):
-            users = get_all_users()
-            if users:
+            try:
+                stats = get_app_stats()
+            except:
+                stats = None
+            if stats:
                 st.markdown("## 📈 App Statistics")
                 
-                # Basic stats
-                avg_age = sum(user['age'] for user in users) / len(users)
-                locations = [user['location'] for user in users]
-                professions = [user['profession'] for user in users]
-                
                 col_stat1, col_stat2 = st.columns(2)
                 
                 with col_stat1:
-                    st.metric("Total Users", len(users))
-                    st.metric("Average Age", f"{avg_age:.1f}")
+                    st.metric("Total Users", stats['total_users'])
+                    st.metric("Average Age", f"{stats['avg_age']:.1f}")
                 
                 with col_stat2:
-                    st.metric("Unique Locations", len(set(locations)))
-                    st.metric("Unique Professions", len(set(professions)))
+                    st.metric("Unique Locations", stats['unique_locations'])
+                    st.metric("Unique Professions", stats['unique_professions'])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
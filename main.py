@@ -1,10 +1,18 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import logging
+import time
 from contextlib import asynccontextmanager
+from typing import Dict, Tuple
 
-from app.api.endpoints import chatbot, dating
+from app.api.endpoints import admin, chatbot, dating
+from app.api.errors import service_error_handler
 from app.core.config import settings
+from app.core.errors import ServiceError
+from app.core.scheduler import WorkloadScheduler, set_scheduler, workload_context
+from app.core.embedding_index import current_version
+from app.core.profiling import LoopMonitor
 from app.services.dating_services import DatingService
 from app.services.chat_services import ChatService
 
@@ -12,6 +20,35 @@ from app.services.chat_services import ChatService
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def follow_index_pointer(service: DatingService, interval: float):
+    """Switch to a newly activated embedding index without restarting"""
+    # A version that fails to load is retried with exponential backoff, not on every poll
+    failures: Dict[str, Tuple[int, float]] = {}
+    with workload_context("batch"):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                version = current_version(settings.embedding_index_dir)
+            except Exception as e:
+                logger.error(f"Index pointer check failed: {e}")
+                continue
+            if not version or version == service.index_version:
+                continue
+            
+            attempts, retry_at = failures.get(version, (0, 0.0))
+            if time.monotonic() < retry_at:
+                continue
+            try:
+                if await service.activate_index(version):
+                    failures.clear()
+                    continue
+            except Exception as e:
+                logger.error(f"Activating index {version} failed: {e}")
+            
+            delay = min(interval * 2 ** attempts, settings.embedding_index_retry_max_s)
+            failures[version] = (attempts + 1, time.monotonic() + delay)
+            logger.warning(f"Index {version} failed {attempts + 1} time(s), retrying in {delay:.0f}s")
+
 # Global service instances
 dating_service = None
 chat_service = None
@@ -22,6 +59,22 @@ async def lifespan(app: FastAPI):
     global dating_service, chat_service
     logger.info("Starting up Dating App...")
     
+    # Record anything that blocks the event loop, with its stack
+    loop_monitor = None
+    if settings.loop_stall_threshold_ms > 0:
+        loop_monitor = LoopMonitor(
+            settings.loop_stall_threshold_ms,
+            settings.loop_monitor_interval_ms,
+            settings.loop_stall_history
+        )
+        loop_monitor.start()
+    app.state.loop_monitor = loop_monitor
+    
+    # Separate executors per workload class so chat bursts cannot starve search
+    scheduler = WorkloadScheduler.from_settings(settings)
+    set_scheduler(scheduler)
+    app.state.scheduler = scheduler
+    
     # Initialize services
     dating_service = DatingService()
     await dating_service.initialize()
@@ -33,11 +86,22 @@ async def lifespan(app: FastAPI):
     app.state.dating_service = dating_service
     app.state.chat_service = chat_service
     
+    index_watcher = None
+    if settings.embedding_index_poll_s > 0:
+        index_watcher = asyncio.create_task(follow_index_pointer(dating_service, settings.embedding_index_poll_s))
+    
     logger.info("Dating App started successfully!")
     yield
     
     # Shutdown
     logger.info("Shutting down Dating App...")
+    if index_watcher is not None:
+        index_watcher.cancel()
+    dating_service.shutdown()
+    if loop_monitor is not None:
+        loop_monitor.stop()
+    set_scheduler(None)
+    scheduler.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
@@ -56,9 +120,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Domain errors (load shedding, deadlines, unavailable shards) become HTTP errors here
+app.add_exception_handler(ServiceError, service_error_handler)
+
 # Include routers
 app.include_router(chatbot.router, prefix="/api/v1/chat", tags=["Chatbot"])
 app.include_router(dating.router, prefix="/api/v1/dating", tags=["Dating"])
+app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin"])
 
 @app.get("/")
 async def root():
@@ -66,7 +134,17 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "services": ["dating", "chat"]}
+    scheduler = getattr(app.state, "scheduler", None)
+    service = getattr(app.state, "dating_service", None)
+    loop_monitor = getattr(app.state, "loop_monitor", None)
+    return {
+        "status": "healthy",
+        "services": ["dating", "chat"],
+        "workloads": scheduler.stats() if scheduler else {},
+        "shards": service.shards.stats() if service and service.shards else {},
+        "interactions": service.interaction_stats() if service else {},
+        "event_loop": loop_monitor.stats() if loop_monitor else {}
+    }
 
 if __name__ == "__main__":
     import uvicorn